@@ -0,0 +1,34 @@
+"""Clocks for the async game engine & players
+
+The engine and NullPlayer ask their clock for the time instead of calling
+time.time() themselves, for binding offer ttls, open offer limits and player
+timers. Normally that's a RealClock. With the STEPPED backend it's a
+VirtualClock, which only moves on when the engine moves it, so a game takes
+as little real time as the cpu allows and plays out the same way every time.
+"""
+import time
+
+
+class RealClock(object):
+    """The wall clock"""
+    def time(self):
+        """Returns the current time in seconds"""
+        return time.time()
+
+
+class VirtualClock(object):
+    """A clock that stands still until it is advanced"""
+    def __init__(self, now=0.):
+        self.now = now
+
+    def time(self):
+        """Returns the current (virtual) time in seconds"""
+        return self.now
+
+    def advance(self, seconds):
+        """Moves the time on by some seconds"""
+        self.now += seconds
+
+    def advance_to(self, when):
+        """Moves the time on to when, if it's later"""
+        self.now = max(self.now, when)
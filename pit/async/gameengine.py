@@ -3,14 +3,19 @@
 TODO:
  - add validation check that offer cards are legal (all same plus bull/bear)
 """
+import collections
 import copy
+import heapq
+import math
 import multiprocessing
 import Queue
 import random
+import struct
 import threading
 import time
 
 from pit import config, util
+from pit.async import clocks, transport
 
 
 class Message(object):
@@ -39,12 +44,45 @@ class Message(object):
                                     # includes cards for players involved
     RING_BELL = 'ring bell'         # ring bell to win the round
 
-    def __init__(self, text, uid=None, cards=[], count=0, target_uid=None, removed_cards=[]):
+    # several encoded messages sent to a player together (batching mode)
+    BATCH = 'batch'
+
+    # on the wire, messages are sent in a compact binary format: a fixed
+    # header (verb code, uids, count, number of cards, ttl in milliseconds &
+    # epoch) followed by one byte per card, using util.CARD_INDEX codes
+    VERBS = [NEW_GAME, NEW_ROUND, ROUND_OVER, GAME_OVER, DONE,
+             ALL_SET, GAME_READY, ROUND_READY, ROUND_DONE, GAME_DONE,
+             OFFER, BINDING_OFFER, WITHDRAW, TRADE, RING_BELL, BATCH]
+    VERB_CODES = dict((verb, code) for code, verb in enumerate(VERBS))
+    HEADER = struct.Struct('!BqqBBBHI')
+    NO_UID = -1
+
+    # the epoch is last in the header, so it can be read on its own
+    EPOCH = struct.Struct('!I')
+    EPOCH_OFFSET = HEADER.size - EPOCH.size
+
+    # longest ttl that fits in the header, in seconds
+    MAX_TTL = (2 ** (8 * struct.calcsize('!H')) - 1) / 1000.
+
+    # a batch is the BATCH code followed by each message, prefixed by its length
+    BATCH_CODE = chr(VERB_CODES[BATCH])
+    BATCH_LENGTH = struct.Struct('!H')
+
+    def __init__(self, text, uid=None, cards=[], count=0, target_uid=None, removed_cards=[], ttl=None, epoch=0):
         """Initialize a Message with the needed info
 
         Note on trades: cards and removed_cards sent only to players involved
                         in the trade. removed_cards will always be the cards for
                         the player to remove from own hand.
+        Note on binding offers: ttl is the number of seconds (to the nearest
+                        millisecond, at least one, up to MAX_TTL) after which
+                        the engine withdraws the offer itself, if it hasn't
+                        been traded. Other ttls raise a ValueError.
+        Note on epochs: the engine moves on to a new epoch at the start of
+                        each game and round, and stamps everything it sends
+                        with it. Players stamp their messages with the latest
+                        epoch they've seen, so messages from an earlier round
+                        can be dropped unread.
         """
         self.text = text
         self.uid = uid
@@ -52,29 +90,210 @@ class Message(object):
         self.count = len(cards) or count
         self.target_uid = target_uid
         self.removed_cards = removed_cards
+        if ttl is not None and not 0 < ttl <= self.MAX_TTL:
+            raise ValueError('ttl must be between 0 and {0} seconds'.format(self.MAX_TTL))
+        self.ttl = ttl
+        self.epoch = epoch
 
     def __str__(self):
         msg = 'MESSAGE {text} {cards} {count} from {uid} to {target_uid}'
         return msg.format(**self.__dict__)
 
+    def encode(self):
+        """Returns the message packed into a byte string"""
+        cards = self.cards or []
+        removed_cards = self.removed_cards or []
+        header = self.HEADER.pack(
+            self.VERB_CODES[self.text],
+            self.NO_UID if self.uid is None else self.uid,
+            self.NO_UID if self.target_uid is None else self.target_uid,
+            self.count,
+            len(cards),
+            len(removed_cards),
+            max(1, int(round(self.ttl * 1000))) if self.ttl else 0,
+            self.epoch)
+        codes = bytearray(util.CARD_INDEX[card] for card in cards + removed_cards)
+        return header + bytes(codes)
+
+    @classmethod
+    def decode(cls, data):
+        """Returns a Message unpacked from a byte string made by encode"""
+        code, uid, target_uid, count, num_cards, num_removed, ttl, epoch = \
+            cls.HEADER.unpack_from(data)
+        cards = [util.CARDS[index] for index in bytearray(data[cls.HEADER.size:])]
+        return cls(cls.VERBS[code],
+                   uid=None if uid == cls.NO_UID else uid,
+                   cards=cards[:num_cards],
+                   count=count,
+                   target_uid=None if target_uid == cls.NO_UID else target_uid,
+                   removed_cards=cards[num_cards:],
+                   ttl=ttl / 1000. if ttl else None,
+                   epoch=epoch)
+
+    @classmethod
+    def epoch_of(cls, data):
+        """Returns the epoch of an encoded message, without decoding it"""
+        return cls.EPOCH.unpack_from(data, cls.EPOCH_OFFSET)[0]
+
+    @classmethod
+    def encode_batch(cls, datas):
+        """Returns encoded messages packed into a single byte string"""
+        parts = [cls.BATCH_CODE]
+        for data in datas:
+            parts.append(cls.BATCH_LENGTH.pack(len(data)))
+            parts.append(data)
+        return ''.join(parts)
+
+    @classmethod
+    def unbatch(cls, data):
+        """Returns the list of encoded messages in a byte string
+
+        The string can be a single message made by encode or a batch made by
+        encode_batch.
+        """
+        if data[:1] != cls.BATCH_CODE:
+            return [data]
+        datas = []
+        start = 1
+        while start < len(data):
+            length, = cls.BATCH_LENGTH.unpack_from(data, start)
+            start += cls.BATCH_LENGTH.size
+            datas.append(data[start:start + length])
+            start += length
+        return datas
+
+    @classmethod
+    def decode_all(cls, data):
+        """Returns the list of Messages in a byte string, see unbatch"""
+        return [cls.decode(item) for item in cls.unbatch(data)]
+
+
+class Barrier(object):
+    """Collects every player's acknowledgement of a step in the game
+
+    e.g. the ROUND_READY from each player for the current epoch. Messages are
+    checked by their encoded header, so the rest (like offers still arriving
+    from the round just over) are skipped without being decoded.
+    """
+    def __init__(self, uids, verb, epoch):
+        self.waiting = set(uids)
+        self.code = Message.VERB_CODES[verb]
+        self.epoch = epoch
+
+    def arrive(self, data):
+        """Takes an encoded message, returns True once all players are in"""
+        header = Message.HEADER.unpack_from(data)
+        if header[0] == self.code and header[-1] == self.epoch:
+            self.waiting.discard(header[1])
+        return not self.waiting
+
+
+class ExpiryWheel(object):
+    """Binding offers filed under the tick of the clock in which they expire
+
+    So the engine can tell how long to wait for messages before the next
+    offers are due to expire, and only looks at those offers when they are.
+    Offers that are traded or withdrawn are left on the wheel, and skipped
+    when expiring.
+    """
+    # seconds per tick
+    TICK = .001
+
+    def __init__(self):
+        self.slots = {}
+        self.ticks = []
+
+    def add(self, offer, expires):
+        """Files an offer to expire at the given time"""
+        tick = int(math.ceil(expires / self.TICK))
+        if tick not in self.slots:
+            self.slots[tick] = []
+            heapq.heappush(self.ticks, tick)
+        self.slots[tick].append(offer)
+
+    def next_expiry(self):
+        """Returns the time the next offers expire, or None"""
+        return self.ticks[0] * self.TICK if self.ticks else None
+
+    def expire(self, now):
+        """Removes & returns all offers expiring by now"""
+        expired = []
+        while self.ticks and self.ticks[0] * self.TICK <= now:
+            expired.extend(self.slots.pop(heapq.heappop(self.ticks)))
+        return expired
+
+
+class BindingOffers(object):
+    """A player's outstanding binding offers
+
+    Offers are indexed by the uid of the player they're made to and their
+    number of cards, so finding one to trade with or withdraw doesn't search
+    through them all, and the cards they lock up are kept counted in a Hand.
+    """
+    def __init__(self):
+        self.offers = {}
+        self.locked = util.Hand()
+
+    def __iter__(self):
+        for offers in self.offers.values():
+            for offer in offers:
+                yield offer
+
+    def __len__(self):
+        return sum(len(offers) for offers in self.offers.values())
+
+    def __contains__(self, offer):
+        return offer in self.offers.get((offer.target_uid, len(offer.cards)), ())
+
+    def add(self, offer):
+        """Adds an offer, locking up its cards"""
+        self.offers.setdefault((offer.target_uid, len(offer.cards)), []).append(offer)
+        self.locked.add(offer.cards)
+
+    def remove(self, offer):
+        """Removes an offer, releasing its cards"""
+        key = (offer.target_uid, len(offer.cards))
+        offers = self.offers[key]
+        offers.remove(offer)
+        if not offers:
+            del self.offers[key]
+        self.locked.remove(offer.cards)
+
+    def match(self, target_uid, count):
+        """Returns the oldest offer to target_uid for count cards, or None"""
+        offers = self.offers.get((target_uid, count))
+        return offers[0] if offers else None
+
+    def find(self, target_uid, cards):
+        """Returns the offer to target_uid of exactly these cards, or None"""
+        for offer in self.offers.get((target_uid, len(cards)), ()):
+            if offer.cards == cards:
+                return offer
+        return None
+
 
 class Player(object):
     """The structure of a Pit player class.
 
     This is basically an interface definition. There are very few requirements
     for a Pit player. It only need to provide a set_up method that can take a
-    Pipe connection and a Queue instance.
+    Pipe connection to receive messages with recv_bytes and a queue to put
+    messages on. Messages are sent both ways encoded with Message.encode. The
+    queue is a transport.PipeSender, or with the other backends a
+    transport.Ring or Channel, and they all have the same methods.
     """
     def __init__(self, name):
         """Player names should be unique and are used to report who won, etc."""
         self.name = name
 
-    def set_up(self, conn, queue):
+    def set_up(self, conn, queue, uid, clock=None):
         """Set up player a connection to the game engine.
 
-        This method is called in a new Process and provides the connection to
-        receive updates from the game engine and the queue to put new messages
-        that the game engine will process.
+        This method is called in a new Process (or Thread, with the THREADS
+        backend) and provides the connection to receive updates from the game
+        engine and the queue to put new messages that the game engine will
+        process. clock is the engine's clock (see pit.async.clocks), if it
+        isn't the wall clock.
         """
         raise NotImplemented
 
@@ -82,11 +301,57 @@ class Player(object):
 class GameEngine(object):
     """This is the Pit game engine. More details to come...
     """
-    def play(self, players, games=1):
+    # ways of running players & carrying messages, see set_up
+    PIPES = 'pipes'
+    RINGS = 'rings'
+    THREADS = 'threads'
+    STEPPED = 'stepped'
+    BACKENDS = [PIPES, RINGS, THREADS, STEPPED]
+
+    # largest batch sent to a player at once, in bytes (the rings' slots are
+    # much smaller, see transport.Ring.max_size)
+    MAX_BATCH_SIZE = 8192
+
+    # reasons for dropping a player's open offer, counted in its 'dropped'
+    DUPLICATE = 'duplicate'
+    RATE_LIMITED = 'rate limited'
+
+    def __init__(self, offer_ttl=None, rate_limit=None, clock=None):
+        """Sets up the limits on open offers, both off by default, and clock
+
+        An open offer from a player for the same count as its live one (the
+        last one rebroadcast) is dropped until offer_ttl seconds have passed.
+        rate_limit is the most open offers per second rebroadcast for each
+        player, allowing bursts of up to a second's worth (or one offer, if
+        the limit is under one a second). Other messages are never dropped,
+        as players expect answers to them. A negative offer_ttl raises a
+        ValueError (the ttls binding offers carry are checked by Message).
+
+        The clock defaults to the wall clock, or a new clocks.VirtualClock for
+        the STEPPED backend (the only one a virtual clock works with).
+        """
+        if offer_ttl is not None and offer_ttl < 0:
+            raise ValueError('offer_ttl must not be negative')
+        self.offer_ttl = offer_ttl
+        self.rate_limit = rate_limit
+        # most offers a player's allowance can hold
+        self.max_allowance = None if rate_limit is None else max(1, rate_limit)
+        self.clock = clock
+
+    def play(self, players, games=1, backend=PIPES, batching=False, pool=None,
+             seed=None):
         """Will play some number of games with the given set of players
+
+        See set_up for the backends & pool and tick for batching. If a seed
+        is given, the random module is seeded with it first, so with the
+        STEPPED backend the same seed plays out the same games.
         """
+        if seed is not None:
+            random.seed(seed)
         self.players = players
-        self.set_up()
+        self.batching = batching
+        self.outboxes = None
+        self.set_up(backend, pool, seed)
         self.wait_for_players(Message.ALL_SET)
         for game in range(games):
             winner = self.one_game()
@@ -94,33 +359,109 @@ class GameEngine(object):
             self.debug()
         self.tear_down()
 
-    def set_up(self):
-        """Sets up players, game state, etc."""
+    def set_up(self, backend=PIPES, pool=None, seed=None):
+        """Sets up players, game state, etc.
+
+        With the PIPES backend each player runs in its own process and gets a
+        Pipe to receive messages on and one to send them, which the engine
+        reads all together. RINGS also runs players in processes but gives
+        each one a pair of shared memory rings instead (see
+        pit.async.transport). THREADS runs all players as threads in this
+        process, talking over in-memory channels, which avoids process start
+        up and IPC costs for lightweight players.
+
+        STEPPED runs the players in the engine's own thread, one step at a
+        time in an order shuffled with the seed, on a virtual clock that the
+        engine moves on (see transport.Stepper). Games are then deterministic
+        and take no longer than the cpu needs. Players must be NullPlayers.
+
+        Players can also be run by the workers of a pit.async.pool.PlayerPool,
+        which are reused from one call to the next. That works like PIPES.
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError('unknown backend {0}'.format(backend))
+        if pool and backend != self.PIPES:
+            raise ValueError('a pool can only be used with the pipes backend')
+        if self.clock is None:
+            if backend == self.STEPPED:
+                self.clock = clocks.VirtualClock()
+            else:
+                self.clock = clocks.RealClock()
+        if isinstance(self.clock, clocks.VirtualClock) and backend != self.STEPPED:
+            raise ValueError('a virtual clock needs the stepped backend')
         self.start_time = time.time()
 
-        self.message_queue = multiprocessing.Queue()
+        self.epoch = 0
+        self.backend = backend
+        self.pool = pool
+        if pool:
+            workers = pool.lease(len(self.players))
+        elif backend == self.THREADS:
+            self.message_queue = transport.Channel()
+        elif backend == self.STEPPED:
+            self.message_queue = transport.Stepper(self.players, self.clock, seed)
+        inboxes = {}
         self.player_data = {}
+        # uids in seat order, as dealt
+        self.uids = []
         for player in self.players:
             uid = id(player.name)
-            parent_conn, child_conn = multiprocessing.Pipe()
-            proc = multiprocessing.Process(
-                target=self.set_up_player, args=(player, child_conn, uid))
+            self.uids.append(uid)
+            if backend == self.STEPPED:
+                parent_conn = child_conn = transport.Channel()
+                proc = None
+            elif pool:
+                proc = workers.pop()
+                parent_conn = proc.conn
+                inboxes[uid] = proc.inbox
+            else:
+                if backend == self.RINGS:
+                    parent_conn = child_conn = transport.Ring()
+                    queue = inboxes[uid] = transport.Ring()
+                elif backend == self.THREADS:
+                    parent_conn = child_conn = transport.Channel()
+                    queue = self.message_queue
+                else:
+                    parent_conn, child_conn = multiprocessing.Pipe()
+                    inboxes[uid], sender = multiprocessing.Pipe(False)
+                    queue = transport.PipeSender(sender)
+                if backend == self.THREADS:
+                    proc = threading.Thread(
+                        target=self.set_up_player, args=(player, child_conn, queue, uid))
+                    proc.daemon = True
+                else:
+                    proc = multiprocessing.Process(
+                        target=self.set_up_player, args=(player, child_conn, queue, uid))
             self.player_data[uid] = {
                 'name': player.name,
                 'conn': parent_conn,
                 'proc': proc,
-                'cards': [],
-                'binding_offers': [],
+                'max_batch': getattr(parent_conn, 'max_size', self.MAX_BATCH_SIZE),
+                'dropped': collections.Counter(),
+                'allowance': self.max_allowance,
+                'allowance_time': self.clock.time(),
+                'cards': util.Hand(),
+                'binding_offers': BindingOffers(),
                 'score': 0,
             }
-            proc.start()
+            if backend == self.STEPPED:
+                player.attach(child_conn, self.message_queue, uid, self.clock)
+            elif pool:
+                proc.seat(player, uid)
+            else:
+                proc.start()
+        if backend == self.RINGS:
+            self.message_queue = transport.RingSet(inboxes.values())
+        elif backend == self.PIPES:
+            self.message_queue = transport.PipeSet(inboxes)
 
-    def set_up_player(self, player, conn, uid):
-        """Creates a new process for a player"""
-        player.set_up(conn, self.message_queue, uid)
+    def set_up_player(self, player, conn, queue, uid):
+        """Runs a player, in its own process or thread"""
+        player.set_up(conn, queue, uid, self.clock)
 
     def one_game(self, starting_dealer=0):
         """Plays one full game"""
+        self.epoch += 1
         self.broadcast(Message(Message.NEW_GAME))
         for uid, data in self.player_data.iteritems():
             data.update({
@@ -142,17 +483,26 @@ class GameEngine(object):
         """Plays one round of the game and updates scores
         """
         self.round_winner = None
+        self.epoch += 1
         for uid, data in self.player_data.iteritems():
             data.update({
-                'cards': [],
-                'binding_offers': [],
+                'cards': util.Hand(),
+                'binding_offers': BindingOffers(),
+                'live_offers': {},
             })
+        self.expiry_wheel = ExpiryWheel()
         self.deal_cards()
         self.wait_for_players(Message.ROUND_READY)
 
         while not self.round_winner:
-            message = self.message_queue.get()
-            self.process_message(message)
+            # only wait for messages until the next binding offers expire
+            timeout = self.expire_offers()
+            if self.batching:
+                self.tick(timeout)
+            else:
+                message = self.receive(timeout)
+                if message:
+                    self.process_message(message)
         self.broadcast(Message(Message.ROUND_OVER))
         self.wait_for_players(Message.ROUND_DONE)
         self.update_scores()
@@ -161,10 +511,10 @@ class GameEngine(object):
         """Notifies players of new game, sends them their cards
         """
         cards = util.deal_cards(len(self.players), self.dealer)
-        for index, (uid, data) in enumerate(self.player_data.iteritems()):
-            data['cards'] = cards[index]
+        for index, uid in enumerate(self.uids):
+            self.player_data[uid]['cards'] = util.Hand(cards[index])
             message = Message(Message.NEW_ROUND, cards=cards[index])
-            data['conn'].send(message)
+            self.send(uid, message)
 
     def next_player(self, player):
         """Returns index of next player"""
@@ -172,9 +522,40 @@ class GameEngine(object):
 
     def process_offer(self, message):
         """Processes an open offer, rebroadcasting it to all other players
+
+        Unless it repeats the player's live offer or is over its rate limit
+        (see __init__), in which case it is dropped.
         """
+        data = self.player_data[message.uid]
+        now = self.clock.time()
+        if self.offer_ttl is not None:
+            sent = data['live_offers'].get(message.count)
+            if sent is not None and now - sent < self.offer_ttl:
+                data['dropped'][self.DUPLICATE] += 1
+                return
+        if not self.take_allowance(data, now):
+            data['dropped'][self.RATE_LIMITED] += 1
+            return
+        data['live_offers'][message.count] = now
         self.broadcast(message, exclude=[message.uid])
 
+    def take_allowance(self, data, now):
+        """Returns True if the player is within its open offer rate limit
+
+        The allowance grows by rate_limit per second, up to max_allowance,
+        and each offer takes one.
+        """
+        if self.rate_limit is None:
+            return True
+        elapsed = now - data['allowance_time']
+        data['allowance'] = min(self.max_allowance,
+                                data['allowance'] + elapsed * self.rate_limit)
+        data['allowance_time'] = now
+        if data['allowance'] < 1:
+            return False
+        data['allowance'] -= 1
+        return True
+
     def process_binding_offer(self, message):
         """Processes a binding offer, locks up cards until traded or withdrawn.
 
@@ -182,12 +563,14 @@ class GameEngine(object):
         """
         # only take action if the player has the cards in this offer
         data = self.player_data[message.uid]
-        if util.has_cards(message.cards, data['cards'], data['binding_offers']):
+        if data['cards'].has_free(message.cards, data['binding_offers'].locked):
             match = self.get_matching_offer(message)
             if match:
                 self.execute_trade(message, match)
             else:
-                data['binding_offers'].append(message)
+                data['binding_offers'].add(message)
+                if message.ttl:
+                    self.expiry_wheel.add(message, self.clock.time() + message.ttl)
                 # make a copy of the offer without the specific cards
                 binding_offer = copy.copy(message)
                 binding_offer.count = len(binding_offer.cards)
@@ -197,19 +580,35 @@ class GameEngine(object):
     def process_withdraw(self, message):
         """Removes a binding offer if it still exists
         """
-        data = self.player_data[message.uid]
-        for offer in data['binding_offers']:
-            if offer.cards == message.cards:
-                data['binding_offers'].remove(offer)
-                withdraw = Message(Message.WITHDRAW,
-                                  uid=message.uid,
-                                  count=len(message.cards),
-                                  target_uid=message.target_uid)
-                self.player_data[message.target_uid]['conn'].send(withdraw)
-                withdraw = copy.copy(withdraw)
-                withdraw.cards = message.cards
-                data['conn'].send(withdraw)
-                break
+        offer = self.player_data[message.uid]['binding_offers'].find(
+            message.target_uid, message.cards)
+        if offer:
+            self.withdraw_offer(offer)
+
+    def withdraw_offer(self, offer):
+        """Removes a binding offer, notifies the players on both sides"""
+        self.player_data[offer.uid]['binding_offers'].remove(offer)
+        withdraw = Message(Message.WITHDRAW,
+                          uid=offer.uid,
+                          count=len(offer.cards),
+                          target_uid=offer.target_uid)
+        self.send(offer.target_uid, withdraw)
+        withdraw = copy.copy(withdraw)
+        withdraw.cards = offer.cards
+        self.send(offer.uid, withdraw)
+
+    def expire_offers(self):
+        """Withdraws binding offers whose ttl is up
+
+        Returns the seconds until the next ones expire, or None if none will.
+        """
+        now = self.clock.time()
+        for offer in self.expiry_wheel.expire(now):
+            # skip offers already traded or withdrawn
+            if offer in self.player_data[offer.uid]['binding_offers']:
+                self.withdraw_offer(offer)
+        next_expiry = self.expiry_wheel.next_expiry()
+        return None if next_expiry is None else max(0, next_expiry - now)
 
     def process_bell_ring(self, message):
         """Broadcasts when a player rings the bell, checks if round over.
@@ -230,13 +629,78 @@ class GameEngine(object):
         if message.text in actions:
             actions[message.text](message)
 
+    def tick(self, timeout=None):
+        """Processes all waiting messages & sends each player a single batch
+
+        Used instead of handling one message at a time in batching mode. Open
+        offers repeated by a player for the same count, and repeated withdraws,
+        are only processed once. Everything sent to a player while processing
+        is collected and sent together at the end. Returns early if there are
+        no messages within timeout seconds.
+        """
+        self.outboxes = dict((uid, []) for uid in self.player_data)
+        try:
+            for message in self.coalesce(self.receive_all(timeout)):
+                self.process_message(message)
+                if self.round_winner:
+                    break
+        finally:
+            outboxes, self.outboxes = self.outboxes, None
+            for uid, datas in outboxes.iteritems():
+                self.flush(uid, datas)
+
+    def coalesce(self, messages):
+        """Returns messages without redundant open offers & withdraws
+
+        The first of each is kept, so the order of the rest is unchanged.
+        """
+        seen = set()
+        coalesced = []
+        for message in messages:
+            if message.text == Message.OFFER:
+                key = (message.text, message.uid, message.count)
+            elif message.text == Message.WITHDRAW:
+                key = (message.text, message.uid, message.target_uid,
+                       tuple(message.cards))
+            else:
+                coalesced.append(message)
+                continue
+            if key not in seen:
+                seen.add(key)
+                coalesced.append(message)
+        return coalesced
+
+    def flush(self, uid, datas):
+        """Sends encoded messages to a player, batched as far as possible"""
+        conn = self.player_data[uid]['conn']
+        max_batch = self.player_data[uid]['max_batch']
+        batch = []
+        size = 1
+        for data in datas:
+            item_size = Message.BATCH_LENGTH.size + len(data)
+            if batch and size + item_size > max_batch:
+                self.send_batch(conn, batch)
+                batch = []
+                size = 1
+            batch.append(data)
+            size += item_size
+        if batch:
+            self.send_batch(conn, batch)
+
+    def send_batch(self, conn, batch):
+        """Sends one message as is, or several as a batch"""
+        if len(batch) == 1:
+            conn.send_bytes(batch[0])
+        else:
+            conn.send_bytes(Message.encode_batch(batch))
+
     def get_matching_offer(self, message):
         """Returns matching binding offer, if one exists (to complete a trade).
+
+        That is one the target player made to this player for as many cards.
         """
-        for offer in self.player_data[message.target_uid]['binding_offers']:
-            if offer.count == message.count:
-                return offer
-        return None
+        return self.player_data[message.target_uid]['binding_offers'].match(
+            message.uid, message.count)
 
     def execute_trade(self, offer, match):
         """Trades cards between two players, notifies other players.
@@ -267,14 +731,85 @@ class GameEngine(object):
         """Steps to close down player processes & threads.
         """
         self.broadcast(Message(Message.DONE))
+        if self.backend == self.STEPPED:
+            # let the players see DONE, nothing runs them after this
+            self.message_queue.step()
+            return
+        if self.pool:
+            # the workers keep running, ready for the next players, so don't
+            # leave them anything that isn't theirs
+            self.discard_messages()
+            self.pool.release([data['proc'] for data in self.player_data.values()])
+            return
         for uid, data in self.player_data.iteritems():
-            data['proc'].join()
+            # a player process can't end until everything it put on the queue
+            # has been read, so keep emptying it
+            while data['proc'].is_alive():
+                self.discard_messages()
+                data['proc'].join(.01)
+
+    def discard_messages(self):
+        """Reads & drops everything waiting on the players' queue"""
+        try:
+            while True:
+                self.message_queue.get_nowait()
+        except Queue.Empty:
+            pass
+
+    def send(self, uid, message):
+        """Send a message to one player"""
+        message.epoch = self.epoch
+        self.deliver(uid, message.encode())
 
     def broadcast(self, message, exclude=[]):
-        """Send a message to all players except optional excluded uid"""
-        for uid, data in self.player_data.iteritems():
+        """Send a message to all players except optional excluded uid
+
+        The message is only encoded once, whatever the number of players.
+        """
+        message.epoch = self.epoch
+        data = message.encode()
+        for uid in self.player_data:
             if uid not in exclude:
-                data['conn'].send(message)
+                self.deliver(uid, data)
+
+    def deliver(self, uid, data):
+        """Sends an encoded message, or holds it for the batch during a tick"""
+        if self.outboxes is None:
+            self.player_data[uid]['conn'].send_bytes(data)
+        else:
+            self.outboxes[uid].append(data)
+
+    def receive(self, timeout=None):
+        """Returns the next message from the players' queue
+
+        Or None if there is none within timeout seconds (if given), or if it
+        is from an earlier epoch (it is dropped without being decoded).
+        """
+        try:
+            data = self.message_queue.get(True, timeout)
+        except Queue.Empty:
+            return None
+        if Message.epoch_of(data) != self.epoch:
+            return None
+        return Message.decode(data)
+
+    def receive_all(self, timeout=None):
+        """Waits for a message, returns it & any others already waiting
+
+        Returns an empty list if there are none within timeout seconds.
+        Messages from earlier epochs are dropped without being decoded.
+        """
+        try:
+            datas = [self.message_queue.get(True, timeout)]
+        except Queue.Empty:
+            return []
+        try:
+            while True:
+                datas.append(self.message_queue.get_nowait())
+        except Queue.Empty:
+            pass
+        return [Message.decode(data) for data in datas
+                if Message.epoch_of(data) == self.epoch]
 
     def broadcast_trade(self, offer, match):
         """Broadcasts TRADE message to all players, including those involved"""
@@ -284,7 +819,7 @@ class GameEngine(object):
                           count=len(offer.cards),
                           target_uid=match.uid,
                           removed_cards=offer.cards)
-        self.player_data[offer.uid]['conn'].send(message)
+        self.send(offer.uid, message)
 
         message = Message(Message.TRADE,
                           uid=match.uid,
@@ -292,7 +827,7 @@ class GameEngine(object):
                           count=len(offer.cards),
                           target_uid=offer.uid,
                           removed_cards=match.cards)
-        self.player_data[match.uid]['conn'].send(message)
+        self.send(match.uid, message)
 
         # make a copy to send to other players, but without specific cards
         message = copy.copy(message)
@@ -302,22 +837,21 @@ class GameEngine(object):
     def wait_for_players(self, expected_message):
         """Loops and reads queue until message is received from all players.
 
-        Discards any message from queue that is not the expected one.
+        Discards any message from queue that is not the expected one for the
+        current epoch.
         """
-        received = set()
-        while len(received) < len(self.players):
-            message = self.message_queue.get()
-            if message.text == expected_message:
-                received.add(message.uid)
+        barrier = Barrier(self.player_data, expected_message, self.epoch)
+        while not barrier.arrive(self.message_queue.get()):
+            pass
 
     def debug(self):
-        msg = '{name} {uid}: {score} {cards} {binding_offers}'
+        msg = '{name} {uid}: {score} {cards} {binding_offers} dropped {dropped}'
         print '---------------------------'
         for uid, data in self.player_data.iteritems():
             offers = []
             for offer in data['binding_offers']:
                 offers.append('BO: {cards} TO {to}'.format(to=offer.target_uid, cards=sorted(offer.cards)))
-            print msg.format(name=data['name'], uid=uid, score=data['score'], cards=sorted(data['cards']), binding_offers=offers)
+            print msg.format(name=data['name'], uid=uid, score=data['score'], cards=sorted(data['cards']), binding_offers=offers, dropped=dict(data['dropped']))
         print '---------------------------'
         print ''
         print ''
@@ -1,9 +1,15 @@
 """Base Player class(es) to provide useful functionality for subclasses.
 """
+import heapq
 import random
 import threading
 
-from pit.async import gameengine
+from pit.async import clocks, gameengine
+
+
+# longest the round loop sleeps with no messages or timers, in seconds, so a
+# player that is waiting on nothing still looks at the game now and then
+IDLE_WAIT = .1
 
 
 class NullPlayer(gameengine.Player):
@@ -13,18 +19,57 @@ class NullPlayer(gameengine.Player):
     threading and messaging to/from the game engine, but never makes any
     actual plays (i.e. making & responding to offers). It also breaks most game
     events into separate methods for easy overriding.
+
+    The round loop is reactive: make_plays is only called again once a
+    message has arrived from the game engine or a timer set with schedule is
+    due, so a player waiting for something to happen doesn't use the cpu.
+
+    With the engine's STEPPED backend there are no threads: the engine calls
+    attach instead of set_up, then step over and over.
     """
-    def set_up(self, conn, queue, uid):
+    def set_up(self, conn, queue, uid, clock=None):
         """Initializes internal state and starts listener thread.
         """
+        self.attach(conn, queue, uid, clock, stepped=False)
+        self.listen()
+
+    def attach(self, conn, queue, uid, clock=None, stepped=True):
+        """Initializes internal state, tells the engine the player is all set
+
+        Unless stepped is False, the player is then run by calling step.
+        """
         self.conn = conn
         self.queue = queue
         self.uid = uid
+        self.clock = clock or clocks.RealClock()
+        self.stepped = stepped
+        self.in_round = False
+        # the latest epoch (game or round) heard of from the game engine
+        self.epoch = 0
         self.done_event = threading.Event()
         self.round_over_event = threading.Event()
         self.game_over_event = threading.Event()
+        # set by the listener thread to wake up the round loop
+        self.wake_event = threading.Event()
+        self.timers = []
+        self.timers_lock = threading.Lock()
+        # when make_plays was last called
+        self.last_plays = None
+        self.actions = {
+            # gameplay events
+            gameengine.Message.NEW_GAME: self.new_game,
+            gameengine.Message.NEW_ROUND: self.new_round,
+            gameengine.Message.ROUND_OVER: self.round_over,
+            gameengine.Message.GAME_OVER: self.game_over,
+            gameengine.Message.DONE: self.done,
+
+            # player actions
+            gameengine.Message.OFFER: self.handle_offer,
+            gameengine.Message.BINDING_OFFER: self.handle_binding_offer,
+            gameengine.Message.TRADE: self.handle_trade,
+            gameengine.Message.WITHDRAW: self.handle_withdraw,
+        }
         self.notify(gameengine.Message.ALL_SET)
-        self.listen()
 
     def new_game(self, message):
         """Resets state at the start of a new game.
@@ -36,9 +81,14 @@ class NullPlayer(gameengine.Player):
         """Resets state at start of a new round.
         """
         self.round_over_event.clear()
-        round_loop = threading.Thread(target=self.round_loop, args=())
-        round_loop.daemon = True
-        round_loop.start()
+        self.in_round = True
+        self.last_plays = None
+        with self.timers_lock:
+            self.timers = []
+        if not self.stepped:
+            round_loop = threading.Thread(target=self.round_loop, args=())
+            round_loop.daemon = True
+            round_loop.start()
         self.notify(gameengine.Message.ROUND_READY)
 
     def round_loop(self):
@@ -47,13 +97,70 @@ class NullPlayer(gameengine.Player):
         This is meant to be run once per round.
         """
         while not self.round_over_event.is_set():
-            self.make_plays()
-
-            # this will block, allowing the current thread to release the cpu
-            # without this, sometimes the thread never ends
-            self.round_over_event.wait(.0001)
+            self.take_turn()
+            self.wait_for_news()
         self.notify(gameengine.Message.ROUND_DONE)
 
+    def take_turn(self):
+        """Calls make_plays, which deals with the news & timers due so far"""
+        # anything arriving while making plays wakes the next wait at once
+        self.wake_event.clear()
+        now = self.last_plays = self.clock.time()
+        with self.timers_lock:
+            while self.timers and self.timers[0] <= now:
+                heapq.heappop(self.timers)
+        self.make_plays()
+
+    def step(self):
+        """Handles waiting messages, then makes plays if there's news
+
+        This does the work of the listener thread and one turn of the round
+        loop, for the STEPPED backend. Returns True if there was anything to
+        do.
+        """
+        busy = False
+        while self.conn.poll():
+            self.receive(self.conn.recv_bytes())
+            busy = True
+        if self.in_round and (self.wake_event.is_set() or
+                              self.clock.time() >= self.next_wake()):
+            self.take_turn()
+            busy = True
+        return busy
+
+    def wait_for_news(self):
+        """Blocks until a message arrives or the next timer is due
+
+        Never waits longer than IDLE_WAIT.
+        """
+        wake = self.next_wake()
+        if wake is not None:
+            self.wake_event.wait(max(0, wake - self.clock.time()))
+
+    def next_wake(self):
+        """Returns the time make_plays is next due, whatever the news
+
+        That's when the next timer is due, or IDLE_WAIT after the last plays,
+        whichever is sooner. Returns None outside of rounds.
+        """
+        if not self.in_round:
+            return None
+        if self.last_plays is None:
+            return self.clock.time()
+        wake = self.last_plays + IDLE_WAIT
+        with self.timers_lock:
+            if self.timers:
+                wake = min(wake, self.timers[0])
+        return wake
+
+    def schedule(self, delay):
+        """Makes the round loop call make_plays again after delay seconds
+
+        e.g. when a player wants to reconsider an offer after a while.
+        """
+        with self.timers_lock:
+            heapq.heappush(self.timers, self.clock.time() + delay)
+
     def make_plays(self):
         """Does nothing (but would be a good place to put actions on the queue)
         """
@@ -63,7 +170,11 @@ class NullPlayer(gameengine.Player):
 
         Sets round over event so round_loop will complete.
         """
+        self.in_round = False
         self.round_over_event.set()
+        if self.stepped:
+            # there's no round loop to do it
+            self.notify(gameengine.Message.ROUND_DONE)
 
     def game_over(self, message):
         """Called when game over message received"""
@@ -92,30 +203,29 @@ class NullPlayer(gameengine.Player):
     def listen(self):
         """Listens for messages from the game engine and update internal state.
         """
-        actions = {
-            # gameplay events
-            gameengine.Message.NEW_GAME: self.new_game,
-            gameengine.Message.NEW_ROUND: self.new_round,
-            gameengine.Message.ROUND_OVER: self.round_over,
-            gameengine.Message.GAME_OVER: self.game_over,
-            gameengine.Message.DONE: self.done,
-
-            # player actions
-            gameengine.Message.OFFER: self.handle_offer,
-            gameengine.Message.BINDING_OFFER: self.handle_binding_offer,
-            gameengine.Message.TRADE: self.handle_trade,
-            gameengine.Message.WITHDRAW: self.handle_withdraw,
-        }
-
         while not self.done_event.is_set():
-            message = self.conn.recv()
-            if message.text in actions:
-                actions[message.text](message)
-
-    def notify(self, message, cards=[], count=0, target_uid=None):
+            self.receive(self.conn.recv_bytes())
+
+    def receive(self, data):
+        """Handles an encoded message (or batch) from the game engine"""
+        # the engine may send several messages at once in batching mode
+        for item in gameengine.Message.unbatch(data):
+            # ignore anything left over from an earlier game or round, unread
+            epoch = gameengine.Message.epoch_of(item)
+            if epoch < self.epoch:
+                continue
+            self.epoch = epoch
+            message = gameengine.Message.decode(item)
+            if message.text in self.actions:
+                self.actions[message.text](message)
+        self.wake_event.set()
+
+    def notify(self, message, cards=[], count=0, target_uid=None, ttl=None):
         """Helper to put a message on the queue"""
         self.queue.put(gameengine.Message(message,
                                           uid=self.uid,
                                           cards=cards,
                                           count=count,
-                                          target_uid=target_uid))
+                                          target_uid=target_uid,
+                                          ttl=ttl,
+                                          epoch=self.epoch).encode())
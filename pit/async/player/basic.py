@@ -6,14 +6,13 @@ TODO
 import copy
 import random
 import threading
-import time
 
 from pit import config, util
 from pit.async import gameengine
 from pit.async.player import base
 
 
-# seconds before withdrawing a binding offer
+# seconds before the engine withdraws a binding offer
 BINDING_OFFER_LIFETIME = .01
 
 # will respond to open offers until hitting this limit
@@ -31,7 +30,6 @@ class SimplePlayer(base.NullPlayer):
         self.locked_cards = []
         self.open_offers = []
         self.incoming_offers = []
-        self.outgoing_offers = []
         super(SimplePlayer, self).new_round(message)
 
     def make_plays(self):
@@ -41,23 +39,9 @@ class SimplePlayer(base.NullPlayer):
             self.notify(gameengine.Message.RING_BELL)
             self.already_rang = True
             return
-        self.clear_outgoing_offers()
         self.check_offers()
         self.make_offers()
 
-    def clear_outgoing_offers(self):
-        """Attempts to withdraw any previous binding offers that have expired.
-        """
-        now = time.time()
-        for added, cards, target_uid in self.outgoing_offers:
-            if now - added > BINDING_OFFER_LIFETIME:
-                if all([card in self.locked_cards for card in cards]):
-                    self.notify(gameengine.Message.WITHDRAW,
-                                cards=cards,
-                                target_uid=target_uid)
-                else:
-                    self.outgoing_offers.remove((added, cards, target_uid))
-
     def check_offers(self):
         """Responds to incoming and open offers"""
         random.shuffle(self.incoming_offers)
@@ -83,9 +67,13 @@ class SimplePlayer(base.NullPlayer):
         except KeyError:
             return None
         if cards:
-            self.notify(gameengine.Message.BINDING_OFFER, cards=cards, target_uid=offer.uid)
+            # lock the cards first, the trade can come back before notify returns
             self.locked_cards.extend(cards)
-            self.outgoing_offers.append((time.time(), cards, offer.uid))
+            # the engine withdraws it if not traded in time
+            self.notify(gameengine.Message.BINDING_OFFER, cards=cards,
+                        target_uid=offer.uid, ttl=BINDING_OFFER_LIFETIME)
+            # look again once it has lapsed, to offer the cards elsewhere
+            self.schedule(BINDING_OFFER_LIFETIME)
             return True
 
     def get_match(self, groups, quantity):
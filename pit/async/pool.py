@@ -0,0 +1,81 @@
+"""Long-lived player processes that game engines can reuse
+
+Normally GameEngine.play starts a new process per player and ends them all in
+tear_down, so every match pays for forking (and anything the players set up
+or cache). A PlayerPool starts its worker processes once. An engine given a
+pool leases a worker per seat, hands it the player to run, and releases the
+workers again once the player has received DONE:
+
+    with pool.PlayerPool(8) as workers:
+        for match in matches:
+            gameengine.GameEngine().play(match, pool=workers)
+
+Each worker has a Pipe in each direction, as with the PIPES backend. A pool
+can only be used by one engine at a time. Players are sent to the workers
+pickled, before their set_up is called, so they're reset for every match like
+a newly started player; the NEW_GAME & NEW_ROUND messages do the rest.
+"""
+import multiprocessing
+
+from pit.async import transport
+
+
+class Worker(object):
+    """A player process that runs one player after another"""
+    def __init__(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.inbox, sender = multiprocessing.Pipe(False)
+        queue = transport.PipeSender(sender)
+        self.proc = multiprocessing.Process(target=self.run, args=(child_conn, queue))
+        self.proc.daemon = True
+        self.proc.start()
+
+    def run(self, conn, queue):
+        """Runs each player sent by seat until stopped
+
+        Player.set_up only returns once the player has received DONE.
+        """
+        while True:
+            player, uid = conn.recv()
+            if player is None:
+                break
+            player.set_up(conn, queue, uid)
+
+    def seat(self, player, uid):
+        """Starts running a player"""
+        self.conn.send((player, uid))
+
+    def stop(self):
+        """Ends the process once the current player (if any) is done"""
+        self.conn.send((None, None))
+        self.proc.join()
+
+
+class PlayerPool(object):
+    """A fixed number of Workers"""
+    def __init__(self, size):
+        self.workers = [Worker() for _ in range(size)]
+        self.idle = list(self.workers)
+
+    def lease(self, count):
+        """Returns count idle workers, which are no longer idle"""
+        if count > len(self.idle):
+            raise ValueError('{0} workers wanted, only {1} idle'.format(
+                count, len(self.idle)))
+        leased, self.idle = self.idle[:count], self.idle[count:]
+        return leased
+
+    def release(self, workers):
+        """Makes leased workers idle again"""
+        self.idle.extend(workers)
+
+    def close(self):
+        """Stops all the workers"""
+        for worker in self.workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,356 @@
+"""Transports for the async game engine: pipes, shared memory rings & in-process
+
+With the PIPES backend each player gets a Pipe in each direction. The engine
+reads from all of them at once through a PipeSet, which waits on them with
+select, so players don't contend for a lock on a single shared Queue.
+
+With the RINGS backend, instead of pipes each player gets two rings: one for
+the engine to send on & the player to receive from, and one for the other
+direction. A ring has a single producer and a single consumer, so neither
+end needs a cross-process lock: the producer only ever moves the head and the
+consumer only ever moves the tail.
+
+Rings hold fixed-size slots of already encoded messages (see Message.encode)
+and provide the same methods as the Pipe connections (send_bytes, recv_bytes,
+poll) and the put & get of a Queue. The engine reads from all players'
+rings at once through a RingSet.
+
+The rings live in memory shared with the player processes when they are
+forked, so this needs a platform with fork.
+
+Players run as threads in the engine's process (the THREADS backend) talk over
+Channels instead, plain in-memory queues with the same methods. With the
+STEPPED backend players talk over Channels too, but have no threads of their
+own: the engine runs them through a Stepper.
+"""
+import collections
+import mmap
+import Queue
+import random
+import select
+import struct
+import threading
+import time
+
+
+# default number of slots per ring & bytes per slot
+SLOTS = 4096
+SLOT_SIZE = 64
+
+# each slot starts with the length of the message in it
+LENGTH = struct.Struct('H')
+
+# the head & tail counters are kept apart so they're on separate cache lines
+COUNTER = struct.Struct('Q')
+HEAD_OFFSET = 0
+TAIL_OFFSET = 64
+SLOTS_OFFSET = 128
+
+# longest sleep while waiting on a full or empty ring, in seconds
+MAX_WAIT = .001
+
+# most messages read from one pipe in a PipeSet sweep, so a player sending
+# non-stop can't keep the engine reading from it alone
+MAX_READS = 64
+
+# virtual seconds that pass each time a Stepper runs the players
+STEP_TIME = .0001
+
+
+def _waits():
+    """Yields forever, sleeping a little longer each time (up to MAX_WAIT)
+
+    The first few waits just yield the cpu, so messages that are arriving
+    quickly are picked up quickly.
+    """
+    delay = 0
+    while True:
+        time.sleep(delay)
+        yield
+        delay = min(MAX_WAIT, delay * 2 or .00001)
+
+
+class Ring(object):
+    """Single producer, single consumer ring buffer in shared memory
+
+    The memory holds two counters, the total number of messages written (the
+    head) and read (the tail), followed by the slots. Each end keeps its own
+    counter locally and only reads the other end's when it has to.
+    """
+    def __init__(self, slots=SLOTS, slot_size=SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        # anonymous maps are shared with processes forked after this
+        self.memory = mmap.mmap(-1, SLOTS_OFFSET + slots * slot_size)
+        # longest message that fits in a slot
+        self.max_size = slot_size - LENGTH.size
+        self.head = self.tail = 0
+        # last known value of the other end's counter
+        self.tail_seen = self.head_seen = 0
+        # the producing process may send from more than one thread
+        self.lock = threading.Lock()
+
+    def put(self, data):
+        """Adds an encoded message, waits while the ring is full"""
+        if len(data) > self.max_size:
+            raise ValueError('message of {0} bytes does not fit in a slot'.format(len(data)))
+        with self.lock:
+            head = self.head
+            if head - self.tail_seen >= self.slots:
+                waits = _waits()
+                while head - self._read_tail() >= self.slots:
+                    next(waits)
+            start = SLOTS_OFFSET + head % self.slots * self.slot_size
+            self.memory[start:start + LENGTH.size + len(data)] = LENGTH.pack(len(data)) + data
+            self.head = head + 1
+            self._write_counter(HEAD_OFFSET, self.head)
+
+    def get(self):
+        """Returns the next encoded message, waits while the ring is empty"""
+        tail = self.tail
+        if tail == self.head_seen:
+            waits = _waits()
+            while tail == self._read_head():
+                next(waits)
+        start = SLOTS_OFFSET + tail % self.slots * self.slot_size
+        length, = LENGTH.unpack_from(self.memory, start)
+        start += LENGTH.size
+        data = self.memory[start:start + length]
+        self.tail = tail + 1
+        self._write_counter(TAIL_OFFSET, self.tail)
+        return data
+
+    def get_all(self):
+        """Returns all the messages waiting (maybe none), without waiting"""
+        head = self._read_head()
+        if head == self.tail:
+            return []
+        memory, slots, slot_size = self.memory, self.slots, self.slot_size
+        messages = []
+        for count in xrange(self.tail, head):
+            start = SLOTS_OFFSET + count % slots * slot_size
+            length, = LENGTH.unpack_from(memory, start)
+            start += LENGTH.size
+            messages.append(memory[start:start + length])
+        self.tail = head
+        self._write_counter(TAIL_OFFSET, head)
+        return messages
+
+    def poll(self):
+        """Returns True if there is a message waiting"""
+        return self.tail != self.head_seen or self.tail != self._read_head()
+
+    def _write_counter(self, offset, value):
+        """Stores the head or tail for the other end to read
+
+        This doesn't use pack_into, which zeroes the bytes before filling them
+        in, so the other end could see a counter of 0 in between.
+        """
+        self.memory[offset:offset + COUNTER.size] = COUNTER.pack(value)
+
+    def _read_head(self):
+        """Updates & returns the consumer's copy of the head"""
+        self.head_seen, = COUNTER.unpack_from(self.memory, HEAD_OFFSET)
+        return self.head_seen
+
+    def _read_tail(self):
+        """Updates & returns the producer's copy of the tail"""
+        self.tail_seen, = COUNTER.unpack_from(self.memory, TAIL_OFFSET)
+        return self.tail_seen
+
+    # same interface as the Pipe connections
+    send_bytes = put
+    recv_bytes = get
+
+
+class RingSet(object):
+    """Consumer end of many rings, read like a single Queue
+
+    Whenever it runs out of messages it takes everything waiting in each of
+    the rings in turn, so a busy player can't crowd out the others and the
+    shared counters are only touched once per ring per sweep.
+    """
+    def __init__(self, rings):
+        self.rings = list(rings)
+        self.messages = collections.deque()
+
+    def get(self, block=True, timeout=None):
+        """Returns the next encoded message from any ring, waits if none
+
+        Like Queue.get, raises Queue.Empty if there are none within timeout
+        seconds (if given).
+        """
+        if not self.messages:
+            if not block:
+                timeout = 0
+            deadline = None if timeout is None else time.time() + timeout
+            waits = _waits()
+            while not self.sweep():
+                if deadline is not None and time.time() >= deadline:
+                    raise Queue.Empty
+                next(waits)
+        return self.messages.popleft()
+
+    def get_nowait(self):
+        """Returns the next encoded message from any ring
+
+        Raises Queue.Empty if there are none, like Queue.get_nowait.
+        """
+        return self.get(False)
+
+    def sweep(self):
+        """Takes the messages waiting in all rings, returns True if any"""
+        for ring in self.rings:
+            self.messages.extend(ring.get_all())
+        return bool(self.messages)
+
+
+class Channel(Queue.Queue):
+    """In-memory queue between the engine and players run as threads
+
+    Messages are still encoded, so players see the same protocol whatever the
+    backend, but nothing is pickled or copied between processes.
+    """
+    # same interface as the Pipe connections
+    send_bytes = Queue.Queue.put
+    recv_bytes = Queue.Queue.get
+
+    def poll(self):
+        """Returns True if there is a message waiting"""
+        return not self.empty()
+
+
+class PipeSender(object):
+    """A player's end of its Pipe to the engine, used like a Queue
+
+    Both of a player's threads send messages, so they take turns.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def put(self, data):
+        """Sends an encoded message"""
+        with self.lock:
+            self.conn.send_bytes(data)
+
+    send_bytes = put
+
+
+class PipeSet(object):
+    """Engine end of the players' Pipes, read like a single Queue
+
+    Messages are read from every pipe that is ready into a backlog per player,
+    and handed out from the backlogs in turn, so a busy player can't crowd out
+    the others, and backlog shows who is behind.
+    """
+    def __init__(self, conns):
+        """conns is a dict of the connections by player uid"""
+        self.uids = list(conns)
+        self.conns = dict((conn, uid) for uid, conn in conns.iteritems())
+        self.backlogs = dict((uid, collections.deque()) for uid in self.uids)
+        self.turn = 0
+
+    def get(self, block=True, timeout=None):
+        """Returns the next encoded message from any pipe, waits if none
+
+        Like Queue.get, raises Queue.Empty if there are none within timeout
+        seconds (if given).
+        """
+        data = self.next_message()
+        if data is None:
+            self.sweep(timeout if block else 0)
+            data = self.next_message()
+            if data is None:
+                raise Queue.Empty
+        return data
+
+    def get_nowait(self):
+        """Returns the next encoded message, raises Queue.Empty if none"""
+        return self.get(False)
+
+    def backlog(self, uid):
+        """Returns how many of a player's messages have been read but not got"""
+        return len(self.backlogs[uid])
+
+    def next_message(self):
+        """Returns the next message from the backlogs, taking turns, or None"""
+        for _ in range(len(self.uids)):
+            backlog = self.backlogs[self.uids[self.turn]]
+            self.turn = (self.turn + 1) % len(self.uids)
+            if backlog:
+                return backlog.popleft()
+        return None
+
+    def sweep(self, timeout=None):
+        """Waits until pipes are ready, reads what's in them into the backlogs
+
+        Pipes whose player has gone away are dropped.
+        """
+        if not self.conns:
+            return
+        ready, _, _ = select.select(list(self.conns), [], [], timeout)
+        for conn in ready:
+            backlog = self.backlogs[self.conns[conn]]
+            try:
+                for _ in range(MAX_READS):
+                    backlog.append(conn.recv_bytes())
+                    if not conn.poll():
+                        break
+            except EOFError:
+                del self.conns[conn]
+
+
+class Stepper(object):
+    """Runs players in the engine's thread, read like a single Queue
+
+    Used by the STEPPED backend, with a virtual clock. Whenever the engine
+    wants a message and there are none, every player takes a step (see
+    NullPlayer.step) in an order shuffled with the seed, and the clock moves
+    on by STEP_TIME. When none of them has anything to do, the clock jumps to
+    whenever the next thing is due: the engine's timeout or a player's wake up.
+    """
+    def __init__(self, players, clock, seed=None):
+        self.players = list(players)
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.messages = collections.deque()
+
+    def put(self, data):
+        """Takes an encoded message from a player"""
+        self.messages.append(data)
+
+    def get(self, block=True, timeout=None):
+        """Returns the next encoded message, running players until there is one
+
+        Like Queue.get, raises Queue.Empty if there is none within timeout
+        (virtual) seconds, if given.
+        """
+        if not block:
+            timeout = 0
+        deadline = None if timeout is None else self.clock.time() + timeout
+        while not self.messages:
+            if deadline is not None and self.clock.time() >= deadline:
+                raise Queue.Empty
+            if self.step():
+                self.clock.advance(STEP_TIME)
+                continue
+            due = [player.next_wake() for player in self.players]
+            due = [when for when in due + [deadline] if when is not None]
+            if not due:
+                raise RuntimeError('players are waiting on nothing')
+            self.clock.advance_to(min(due))
+        return self.messages.popleft()
+
+    def get_nowait(self):
+        """Returns the next encoded message, raises Queue.Empty if none"""
+        return self.get(False)
+
+    def step(self):
+        """Runs each player once, returns True if any of them did anything"""
+        players = self.players[:]
+        self.random.shuffle(players)
+        busy = False
+        for player in players:
+            busy = player.step() or busy
+        return busy
@@ -0,0 +1,62 @@
+"""Benchmarks for the game engines and the util module
+
+Run them with python -m pit.benchmark (see --help for options). Results are
+written as JSON: one record per benchmark and player count, plus details of
+the environment (git commit, python version) so that runs can be compared
+across commits.
+"""
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+# benchmarks are run for each of these numbers of players by default
+PLAYER_COUNTS = range(3, 9)
+
+NAMES = ['bob', 'joe', 'sue', 'tim', 'ned', 'deb', 'pat', 'kim']
+
+
+def record(benchmark, players, elapsed, **metrics):
+    """Returns a result record for one benchmark run"""
+    result = {
+        'benchmark': benchmark,
+        'players': players,
+        'seconds': elapsed,
+    }
+    result.update(metrics)
+    return result
+
+
+def rate(count, elapsed):
+    """Returns count per second, guarding against a zero elapsed time"""
+    return count / elapsed if elapsed else None
+
+
+def environment():
+    """Returns details about where & when the benchmarks were run"""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            commit = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.time(),
+    }
+
+
+class quiet(object):
+    """Context manager that silences stdout, e.g. the async engine's prints"""
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stdout = self.stdout
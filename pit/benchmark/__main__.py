@@ -0,0 +1,76 @@
+"""Runs the benchmarks and writes the results as JSON
+
+    python -m pit.benchmark [--suites sync async util] [--players 3 4 5]
+"""
+import argparse
+import json
+import sys
+
+from pit import benchmark
+from pit.async import gameengine
+from pit.benchmark import async, sync, util
+
+
+SUITES = {
+    'sync': lambda args: sync.run(args.players, games=args.games, seed=args.seed,
+                                  batch_events=args.batch_events,
+                                  concurrent=args.concurrent),
+    'async': lambda args: async.run(args.players, rounds=args.rounds,
+                                    backend=args.backend,
+                                    batching=args.batching,
+                                    pool=args.pool,
+                                    offer_ttl=args.offer_ttl,
+                                    rate_limit=args.rate_limit,
+                                    seed=args.seed),
+    'util': lambda args: util.run(args.players, number=args.number),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pit benchmarks')
+    parser.add_argument('--suites', nargs='+', choices=sorted(SUITES),
+                        default=['sync', 'util'],
+                        help='benchmarks to run (async is slow, so off by default)')
+    parser.add_argument('--players', nargs='+', type=int,
+                        default=benchmark.PLAYER_COUNTS,
+                        help='numbers of players to run each benchmark with')
+    parser.add_argument('--games', type=int, default=5,
+                        help='games per sync engine run')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the sync engine & async engine games')
+    parser.add_argument('--batch-events', action='store_true',
+                        help='deliver sync engine notifications to players in batches')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='host sync engine players in their own processes')
+    parser.add_argument('--rounds', type=int, default=1,
+                        help='rounds per async engine run')
+    parser.add_argument('--backend', choices=gameengine.GameEngine.BACKENDS,
+                        default=gameengine.GameEngine.PIPES,
+                        help='how async engine players are run & talk to the engine')
+    parser.add_argument('--batching', action='store_true',
+                        help='batch & coalesce messages in async runs')
+    parser.add_argument('--pool', action='store_true',
+                        help='run async players in one reused pool of processes')
+    parser.add_argument('--offer-ttl', type=float,
+                        help='seconds before the async engine rebroadcasts a repeated open offer')
+    parser.add_argument('--rate-limit', type=float,
+                        help='most open offers per second the async engine takes from a player')
+    parser.add_argument('--number', type=int, default=10000,
+                        help='calls per util microbenchmark')
+    parser.add_argument('--output', type=argparse.FileType('w'),
+                        default=sys.stdout,
+                        help='file to write JSON results to')
+    args = parser.parse_args(argv)
+
+    results = []
+    for suite in args.suites:
+        results.extend(SUITES[suite](args))
+    json.dump({
+        'environment': benchmark.environment(),
+        'results': results,
+    }, args.output, indent=2, sort_keys=True)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
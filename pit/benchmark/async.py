@@ -0,0 +1,78 @@
+"""Message throughput and round latency of the async game engine
+
+SimplePlayers can take minutes to finish a full game, so each run is cut off
+after a fixed number of rounds.
+"""
+import time
+
+from pit import benchmark
+from pit.async import gameengine
+from pit.async import pool as playerpool
+from pit.async.player import basic
+
+
+class TimingGameEngine(gameengine.GameEngine):
+    """Async GameEngine that counts messages and times rounds
+
+    The game is ended after the given number of rounds.
+    """
+    def __init__(self, rounds=1, **kwargs):
+        super(TimingGameEngine, self).__init__(**kwargs)
+        self.rounds = rounds
+        self.messages = 0
+        self.round_times = []
+
+    def one_round(self):
+        start = time.time()
+        super(TimingGameEngine, self).one_round()
+        self.round_times.append(time.time() - start)
+        if len(self.round_times) % self.rounds == 0:
+            self.game_winner = self.round_winner
+
+    def process_message(self, message):
+        self.messages += 1
+        super(TimingGameEngine, self).process_message(message)
+
+
+def run(player_counts=benchmark.PLAYER_COUNTS, rounds=1,
+        backend=gameengine.GameEngine.PIPES, batching=False, pool=False,
+        offer_ttl=None, rate_limit=None, seed=None):
+    """Plays rounds for each player count, returns result records
+
+    backend is one of the GameEngine backends (pipes, rings or threads) and
+    batching turns on the engine's batching mode. If pool is True the players
+    are run by one PlayerPool for all player counts. offer_ttl and rate_limit
+    are passed on to the engine, and seed to play (with the stepped backend,
+    the same seed gives the same games).
+    """
+    results = []
+    workers = playerpool.PlayerPool(max(player_counts)) if pool else None
+    for count in player_counts:
+        engine = TimingGameEngine(rounds=rounds, offer_ttl=offer_ttl,
+                                  rate_limit=rate_limit)
+        players = [basic.SimplePlayer(name) for name in benchmark.NAMES[:count]]
+        start = time.time()
+        with benchmark.quiet():
+            engine.play(players, games=1, backend=backend, batching=batching,
+                        pool=workers, seed=seed)
+        elapsed = time.time() - start
+        round_time = sum(engine.round_times)
+        results.append(benchmark.record(
+            'async.engine', count, elapsed,
+            rounds=len(engine.round_times),
+            backend=backend,
+            batching=batching,
+            pool=pool,
+            offer_ttl=offer_ttl,
+            rate_limit=rate_limit,
+            seed=seed,
+            dropped=sum(sum(data['dropped'].values())
+                        for data in engine.player_data.values()),
+            messages=engine.messages,
+            messages_per_sec=benchmark.rate(engine.messages, round_time),
+            round_latency_mean=round_time / len(engine.round_times),
+            round_latency_min=min(engine.round_times),
+            round_latency_max=max(engine.round_times)))
+    if workers:
+        workers.close()
+    return results
@@ -0,0 +1,54 @@
+"""Throughput of the synchronous game engine with BasicPlayers
+"""
+import time
+
+from pit import benchmark
+from pit.sync import gameengine
+from pit.sync.player import basic
+
+
+class CountingGameEngine(gameengine.GameEngine):
+    """Sync GameEngine that counts the cycles played & actions processed
+
+    BasicPlayers can get stuck, so rounds are ended without a winner after
+    gameengine.MAX_ROUND_CYCLES.
+    """
+    cycles = 0
+    actions = 0
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_round_cycles', gameengine.MAX_ROUND_CYCLES)
+        super(CountingGameEngine, self).__init__(**kwargs)
+
+    def one_cycle(self):
+        self.cycles += 1
+        super(CountingGameEngine, self).one_cycle()
+
+    def process_action(self, action):
+        self.actions += 1
+        super(CountingGameEngine, self).process_action(action)
+
+
+def run(player_counts=benchmark.PLAYER_COUNTS, games=5, seed=0,
+        batch_events=False, concurrent=False):
+    """Plays seeded games for each player count, returns result records"""
+    results = []
+    for count in player_counts:
+        engine = CountingGameEngine(batch_events=batch_events,
+                                    concurrent=concurrent)
+        players = [basic.BasicPlayer(name) for name in benchmark.NAMES[:count]]
+        start = time.time()
+        engine.play(players, games=games, seed=seed)
+        elapsed = time.time() - start
+        results.append(benchmark.record(
+            'sync.engine', count, elapsed,
+            games=games,
+            batch_events=batch_events,
+            concurrent=concurrent,
+            cycles=engine.cycles,
+            actions=engine.actions,
+            stalled_rounds=engine.stalled_rounds,
+            games_per_sec=benchmark.rate(games, elapsed),
+            cycles_per_sec=benchmark.rate(engine.cycles, elapsed),
+            actions_per_sec=benchmark.rate(engine.actions, elapsed)))
+    return results
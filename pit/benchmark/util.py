@@ -0,0 +1,85 @@
+"""Microbenchmarks of the pit.util functions
+
+Functions that accept Hands as well as lists are timed with both. trade times
+what the sync engine does with the players' hands for a trade: check both
+players have the cards, swap them and check the hands for a win.
+"""
+import collections
+import timeit
+
+from pit import benchmark, config, util
+
+
+# stands in for the locked offers passed to has_cards
+LockedGroup = collections.namedtuple('LockedGroup', ['cards'])
+
+
+def cases(count):
+    """Returns (name, variant, function) for each call to time
+
+    Uses a dealt hand for the given number of players.
+    """
+    hands = util.deal_cards(count, 0)
+    cards, other = hands[1], hands[2]
+    trade, other_trade = cards[:2], other[:2]
+    locked = [LockedGroup(cards[2:4])]
+    groups = util.available_card_groups(cards, [])
+    groups[config.BULL] = 1
+    hand, other_hand = util.Hand(cards), util.Hand(other)
+
+    def swap(cards, other):
+        """Swaps and swaps back, so the hands are unchanged"""
+        def run():
+            util.swap_cards(cards, trade, other, other_trade)
+            util.swap_cards(cards, other_trade, other, trade)
+        return run
+
+    def exchange(cards, other):
+        """Trades and trades back, checking as the engine does each time"""
+        def run():
+            for give, take in [(trade, other_trade), (other_trade, trade)]:
+                if (util.has_cards(give, cards, []) and
+                        util.has_cards(take, other, [])):
+                    util.swap_cards(cards, give, other, take)
+                    util.is_winning_hand(cards)
+                    util.is_winning_hand(other)
+        return run
+
+    calls = []
+    for variant, hand_cards, other_cards in [('list', cards, other),
+                                             ('hand', hand, other_hand)]:
+        calls.extend([
+            ('swap_cards', variant, swap(hand_cards, other_cards)),
+            ('trade', variant, exchange(hand_cards, other_cards)),
+            ('has_cards', variant,
+             lambda c=hand_cards: util.has_cards(trade, c, locked)),
+            ('is_winning_hand', variant,
+             lambda c=hand_cards: util.is_winning_hand(c)),
+            ('score_hand', variant, lambda c=hand_cards: util.score_hand(c)),
+            ('available_card_groups', variant,
+             lambda c=hand_cards: util.available_card_groups(c, trade)),
+        ])
+    calls.extend([
+        ('matching_groups', 'list', lambda: util.matching_groups(groups, 2)),
+        ('matching_groups_with', 'list',
+         lambda: util.matching_groups_with([config.BULL], groups, 2)),
+        ('deal_cards', 'list', lambda: util.deal_cards(count, 0)),
+    ])
+    return calls
+
+
+def run(player_counts=benchmark.PLAYER_COUNTS, number=10000):
+    """Times each util function for each player count, returns records"""
+    results = []
+    for count in player_counts:
+        for name, variant, function in cases(count):
+            elapsed = min(timeit.repeat(function, number=number, repeat=3))
+            # swaps & trades run twice per call to leave the hands unchanged
+            calls = number * 2 if name in ['swap_cards', 'trade'] else number
+            results.append(benchmark.record(
+                'util.' + name, count, elapsed,
+                variant=variant,
+                calls=calls,
+                calls_per_sec=benchmark.rate(calls, elapsed),
+                usec_per_call=elapsed / calls * 1e6))
+    return results
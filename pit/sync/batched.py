@@ -0,0 +1,302 @@
+"""Vectorized version of the synchronous Pit game engine
+
+BatchedGameEngine plays many independent tables in lockstep. Rather than
+objects per player and per action, the state of every table is held in NumPy
+arrays with the table as the first dimension:
+
+- hands: (tables, players, card types) card counts, indexed like util.Hand
+- busy_until: (tables, players) cycle at which each player is available again
+- offers: (tables, players, 4) cycle in which each player's offer for 1-4
+  cards was made, or -1 if they have no such offer
+- notified: (tables, players, players, 4) cycle of the last offer by each
+  other player that each player was notified of, or -1 (players may clear
+  their own entries once they are no longer interested in an offer)
+
+Each cycle follows the rules of pit.sync.gameengine: only available players
+act, all actions are based on the state at the end of the previous cycle and
+are executed one at a time in random order, and OFFER_CYCLES, OFFER_DURATION,
+RESPONSE_DURATION and TRADE_DURATION mean exactly the same thing. Actions are
+executed one position of the random order at a time, so within a table they
+still happen one after another, but each position is handled for every table
+with a single set of array operations.
+
+Players are batched players (see pit.sync.player.batched), each choosing the
+actions for one seat at all of the tables at once.
+
+This module needs numpy, which the rest of pit does not.
+"""
+import numpy as np
+
+from pit import config, util
+from pit.sync import gameengine
+
+
+# action types, as returned by batched players
+PASS = 0
+OFFER = 1
+RESPONSE = 2
+BELL = 3
+
+# largest offer allowed, same as gameengine.Offer
+MAX_QUANTITY = 4
+
+NUM_CARDS = len(util.CARDS)
+# point value of each card type when it makes up a winning hand
+CARD_VALUES = np.array([config.COMMODITY_VALUES.get(card, 0)
+                        for card in util.CARDS])
+
+
+def is_winning(hands):
+    """Returns True where hands (..., card types) are winning hands"""
+    count = hands[..., :util.NUM_COMMODITIES].max(axis=-1)
+    bull = hands[..., util.BULL_INDEX] > 0
+    return (hands[..., util.BEAR_INDEX] == 0) & (
+        (count == config.COMMODITIES_PER_HAND) |
+        ((count == config.COMMODITIES_PER_HAND - 1) & bull))
+
+
+def score(hands):
+    """Returns point values of hands (..., card types), like util.score_hand"""
+    commodities = hands[..., :util.NUM_COMMODITIES]
+    count = commodities.max(axis=-1)
+    bull = hands[..., util.BULL_INDEX] > 0
+    bear = hands[..., util.BEAR_INDEX] > 0
+    bonus = np.where((count == config.COMMODITIES_PER_HAND) & bull, 2, 1)
+    winning_score = CARD_VALUES[commodities.argmax(axis=-1)] * bonus
+    penalty = -(config.BEAR_PENALTY * bear + config.BULL_PENALTY * bull)
+    return np.where(is_winning(hands), winning_score, penalty)
+
+
+def random_choice(options, random):
+    """Picks one True column per row of a 2D bool array at random
+
+    Returns (choice, found) arrays, found is False for rows with no options.
+    """
+    scores = random.random_sample(options.shape)
+    scores[~options] = -1
+    return scores.argmax(axis=1), options.any(axis=1)
+
+
+class BatchedGameEngine(object):
+    """Plays games of Pit on many tables at once
+
+    Every table has the same players, in the same seats. Rounds that go on
+    for max_round_cycles without anyone winning are ended anyway, as with
+    GameEngine's option, as batched BasicPlayers can get stuck just like
+    BasicPlayers do. None turns that off.
+    """
+    def __init__(self, tables=1000, seed=None,
+                 max_round_cycles=gameengine.MAX_ROUND_CYCLES):
+        self.tables = tables
+        self.random = np.random.RandomState(seed)
+        self.max_round_cycles = max_round_cycles
+
+    def play(self, players, games=1):
+        """Plays a number of games spread over the tables
+
+        Returns a dict of wins keyed by player, the same as GameEngine.play.
+        """
+        self.players = players
+        tables, seats = self.tables, len(players)
+        self.hands = np.zeros((tables, seats, NUM_CARDS), dtype=np.int16)
+        self.scores = np.zeros((tables, seats), dtype=int)
+        self.dealer = np.zeros(tables, dtype=int)
+        self.cycle = np.zeros(tables, dtype=int)
+        self.busy_until = np.zeros((tables, seats), dtype=int)
+        self.offers = np.full((tables, seats, MAX_QUANTITY), -1, dtype=int)
+        self.notified = np.full(
+            (tables, seats, seats, MAX_QUANTITY), -1, dtype=int)
+        self.active = np.zeros(tables, dtype=bool)
+        self.wins = np.zeros(seats, dtype=int)
+
+        # counters, summed over all tables
+        self.total_cycles = 0
+        self.total_actions = 0
+        self.total_rounds = 0
+        self.total_stalled_rounds = 0
+
+        self.games_left = games
+        self.start_games(np.arange(min(tables, games)))
+        while self.active.any():
+            self.one_cycle()
+        return dict(zip(players, self.wins.tolist()))
+
+    def start_games(self, rows):
+        """Starts new games at the given tables"""
+        self.games_left -= rows.size
+        self.active[rows] = True
+        self.scores[rows] = 0
+        self.dealer[rows] = self.random.randint(0, len(self.players), rows.size)
+        self.start_rounds(rows)
+
+    def start_rounds(self, rows):
+        """Deals and resets the round state at the given tables"""
+        self.deal_cards(rows)
+        self.cycle[rows] = 0
+        self.busy_until[rows] = 0
+        self.offers[rows] = -1
+        self.notified[rows] = -1
+
+    def deal_cards(self, rows):
+        """Deals new hands at the given tables, like util.deal_cards"""
+        seats = len(self.players)
+        per_hand = config.COMMODITIES_PER_HAND
+        deck = np.array(
+            [card for card in range(seats) for _ in range(per_hand)] +
+            [util.BULL_INDEX, util.BEAR_INDEX])
+        order = self.random.random_sample((rows.size, deck.size)).argsort(axis=1)
+
+        owners = np.empty((rows.size, deck.size), dtype=int)
+        owners[:, :-2] = np.arange(deck.size - 2) // per_hand
+        owners[:, -2] = (self.dealer[rows] + 1) % seats
+        owners[:, -1] = (self.dealer[rows] + 2) % seats
+
+        self.hands[rows] = 0
+        np.add.at(self.hands, (rows[:, None], owners, deck[order]), 1)
+
+    def one_cycle(self):
+        """One cycle gives each available player at every table an action"""
+        kinds, quantities, offerers, cards = self.collect_actions()
+        self.total_cycles += self.active.sum()
+        self.total_actions += (kinds != PASS).sum()
+
+        in_play = self.active.copy()
+        order = self.random.random_sample(kinds.shape).argsort(axis=1)
+        all_rows = np.arange(self.tables)
+        for position in range(len(self.players)):
+            actors = order[:, position]
+            kind = np.where(in_play, kinds[all_rows, actors], PASS)
+
+            rows = np.flatnonzero(kind == OFFER)
+            self.add_offers(rows, actors[rows], quantities[rows, actors[rows]])
+
+            rows = np.flatnonzero(kind == RESPONSE)
+            self.send_responses(rows,
+                                actors[rows],
+                                offerers[rows, actors[rows]],
+                                quantities[rows, actors[rows]],
+                                cards[rows, actors[rows]])
+
+            rows = np.flatnonzero(kind == BELL)
+            in_play[self.ring_bells(rows, actors[rows])] = False
+
+        rows = np.flatnonzero(in_play)
+        self.cycle[rows] += 1
+        self.end_cycle(rows)
+        if self.max_round_cycles is not None:
+            stalled = in_play & (self.cycle >= self.max_round_cycles)
+            self.total_stalled_rounds += stalled.sum()
+            in_play &= ~stalled
+        over = np.flatnonzero(self.active & ~in_play)
+        if over.size:
+            self.end_rounds(over)
+
+    def collect_actions(self):
+        """Gets actions from each seat for every table it is available at
+
+        Returns arrays of kinds, quantities and offerers, all (tables, seats),
+        plus the cards for responses as (tables, seats, card types).
+        """
+        shape = self.busy_until.shape
+        kinds = np.zeros(shape, dtype=int)
+        quantities = np.zeros(shape, dtype=int)
+        offerers = np.zeros(shape, dtype=int)
+        cards = np.zeros(self.hands.shape, dtype=self.hands.dtype)
+
+        available = self.active[:, None] & (self.cycle[:, None] >= self.busy_until)
+        for seat, player in enumerate(self.players):
+            rows = np.flatnonzero(available[:, seat])
+            if rows.size:
+                (kinds[rows, seat],
+                 quantities[rows, seat],
+                 offerers[rows, seat],
+                 cards[rows, seat]) = player.get_actions(self, seat, rows)
+        return kinds, quantities, offerers, cards
+
+    def add_offers(self, rows, players, quantities):
+        """Adds offers, notifying other available players at those tables"""
+        slots = quantities - 1
+        cycle = self.cycle[rows]
+        self.offers[rows, players, slots] = cycle
+
+        available = cycle[:, None] >= self.busy_until[rows]
+        available[np.arange(rows.size), players] = False
+        notified = self.notified[rows, :, players, slots]
+        self.notified[rows, :, players, slots] = np.where(
+            available, cycle[:, None], notified)
+
+        self.busy_until[rows, players] = cycle + gameengine.OFFER_DURATION
+
+    def send_responses(self, rows, players, offerers, quantities, cards):
+        """Sends responses to the players who made the offers
+
+        Same rules as GameEngine.send_response: the trade goes through only if
+        the offer is still open, the responding player still has the cards,
+        and the offering player accepts with cards they have.
+        """
+        slots = quantities - 1
+        accepted = ((self.offers[rows, offerers, slots] >= 0) &
+                    (players != offerers) &
+                    (self.hands[rows, players] >= cards).all(axis=1))
+        confirm_cards = np.zeros_like(cards)
+        for seat in np.unique(offerers[accepted]):
+            index = np.flatnonzero(accepted & (offerers == seat))
+            seat_rows = rows[index]
+            seat_cards, seat_accepted = self.players[seat].response_made(
+                self, seat, seat_rows, quantities[index])
+            seat_accepted &= (self.hands[seat_rows, seat] >= seat_cards).all(axis=1)
+            confirm_cards[index] = seat_cards
+            accepted[index] = seat_accepted
+
+        index = np.flatnonzero(accepted)
+        traded_rows = rows[index]
+        players_in, offerers_in = players[index], offerers[index]
+        self.hands[traded_rows, players_in] += confirm_cards[index] - cards[index]
+        self.hands[traded_rows, offerers_in] += cards[index] - confirm_cards[index]
+        self.offers[traded_rows, offerers_in, slots[index]] = -1
+        busy_until = self.cycle[traded_rows] + gameengine.TRADE_DURATION
+        self.busy_until[traded_rows, players_in] = busy_until
+        self.busy_until[traded_rows, offerers_in] = busy_until
+
+        index = np.flatnonzero(~accepted)
+        self.busy_until[rows[index], players[index]] = (
+            self.cycle[rows[index]] + gameengine.RESPONSE_DURATION)
+
+    def ring_bells(self, rows, players):
+        """Returns the tables where the bell was rung with a winning hand"""
+        return rows[is_winning(self.hands[rows, players])]
+
+    def end_cycle(self, rows):
+        """Removes expired offers at the given tables
+
+        Busy players need no bookkeeping, they are available again as soon as
+        the cycle reaches busy_until.
+        """
+        offers = self.offers[rows]
+        age = self.cycle[rows][:, None, None] - offers
+        offers[(offers >= 0) & (age > gameengine.OFFER_CYCLES)] = -1
+        self.offers[rows] = offers
+
+    def end_rounds(self, rows):
+        """Updates scores at tables whose round is over, starts what's next
+
+        As in GameEngine.update_scores, if more than one player reaches the
+        winning score, the last of them in seat order wins.
+        """
+        self.total_rounds += rows.size
+        seats = len(self.players)
+        self.scores[rows] += score(self.hands[rows])
+        reached = self.scores[rows] >= config.WINNING_SCORE
+        has_winner = reached.any(axis=1)
+        winners = seats - 1 - reached[:, ::-1].argmax(axis=1)
+        np.add.at(self.wins, winners[has_winner], 1)
+
+        rows_next = rows[~has_winner]
+        self.dealer[rows_next] = (self.dealer[rows_next] + 1) % seats
+        self.start_rounds(rows_next)
+
+        finished = rows[has_winner]
+        restart = finished[:self.games_left]
+        self.active[finished[restart.size:]] = False
+        if restart.size:
+            self.start_games(restart)
@@ -16,14 +16,32 @@ responds directly to them about a previous offer. The delayed player will still
 be notified and will still be able to make the trade (causing them to get
 delayed yet again).
 
+Offers are only sent to players interested in their quantity. Each player is
+asked for the quantities it wants to hear about (Player.interests) when it gets
+a new hand, at the start of a round and after each of its trades, and offers
+are routed through an index of subscribers by quantity. Players that don't say
+(the default) hear about every offer.
+
+With batch_events, the notifications players are sent as things happen
+(offer_made, offer_expired, trade_confirmation & closing_bell) are held back
+and delivered together in one call to Player.events, just before the player is
+next called for anything else (get_action, response_made, etc.) or the round
+ends. Players see the same events in the same order either way, so games play
+out exactly the same.
+
+With concurrent, each player is hosted in its own process (see pit.sync.remote)
+and every available player is asked for its action before any of them are
+collected, so the players make their decisions for a cycle at the same time.
+
 TODO LIST:
 - notification about responses made and rejected
 """
-import copy
+import heapq
 import itertools
 import random
 
 from pit import config, util
+from pit.sync import profiling, remote
 
 
 # number of cycles before an offer expires
@@ -34,12 +52,66 @@ OFFER_DURATION = 1
 RESPONSE_DURATION = 2
 # cycles a player must wait after participating in a trade
 TRADE_DURATION = 4
+# BasicPlayers can get stuck when nobody's groups can match anyone's offers,
+# a sensible max_round_cycles for them (see GameEngine)
+MAX_ROUND_CYCLES = 5000
+
+
+def game_seed(seed, game):
+    """Returns the random seed for one game of a seeded run of games"""
+    return (seed << 32) + game
 
 
 class Action(object):
+    """Base class for the actions players return from get_action
+
+    Actions are immutable. The engine stamps each one with a unique id and the
+    cycle it was made in, after which the very same instance is passed to
+    every player notified about it, so there is no need to copy them. Actions
+    are equal if they have the same id (or are the same unstamped instance).
+    They hash on what they're made with rather than the id, so an action put
+    in a set or dict before it's stamped can still be found there after.
+    """
+    __slots__ = ('player', 'cycle', 'id')
+
     def __init__(self, player):
-        self.player = player
-        self.cycle = -1 # to be set by game engine
+        self._set(player=player,
+                  cycle=-1, # to be set by game engine
+                  id=None)  # to be set by game engine
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{0} is immutable'.format(type(self).__name__))
+
+    def _set(self, **fields):
+        """Sets fields, only for use while creating an action"""
+        for name, value in fields.iteritems():
+            object.__setattr__(self, name, value)
+
+    def _fields(self):
+        """Returns names of all fields, including those of superclasses"""
+        return [name for cls in type(self).__mro__
+                for name in getattr(cls, '__slots__', ())]
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self._fields())
+
+    def __setstate__(self, state):
+        self._set(**state)
+
+    def __eq__(self, action):
+        if self.id is None:
+            return self is action
+        # ids are only unique within a game, the rest keeps equal actions
+        # hashing alike even if one is from another game
+        return (isinstance(action, Action) and self.id == action.id and
+                type(self) is type(action) and
+                self.player.name == action.player.name)
+
+    def __ne__(self, action):
+        return not self == action
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.player.name))
 
     def __unicode__(self):
         return 'Action'
@@ -51,34 +123,39 @@ class Action(object):
         return unicode(self).encode('utf-8')
 
     def copy(self):
-        """Should return a new instance that is a copy of the action"""
-        raise NotImplementedError
+        """Returns a new instance that is a copy (and so equal to) the action
+        """
+        action = object.__new__(type(self))
+        action.__setstate__(self.__getstate__())
+        return action
+
+    def stamped(self, action_id, cycle):
+        """Returns the action with the id & cycle set, for use by game engine
+
+        An action is stamped in place the first time. If it has already been
+        stamped (e.g. a player returned the same action twice), a new stamped
+        copy is returned instead.
+        """
+        action = self if self.id is None else self.copy()
+        action._set(id=action_id, cycle=cycle)
+        return action
 
 
 class Offer(Action):
     """An offer to trade a certain number of cards, made to anyone/everyone.
     """
+    __slots__ = ('quantity',)
+
     def __init__(self, player, quantity):
         super(Offer, self).__init__(player)
         if quantity > 4:
             raise Exception('Offers can only be up to four cards')
-        self.quantity = quantity
+        self._set(quantity=quantity)
 
     def __unicode__(self):
         return 'Offer in cycle {2} by {0} for {1}'.format(
             self.player, self.quantity, self.cycle)
 
-    def copy(self):
-        """Returns a copy of this offer"""
-        offer = Offer(self.player, self.quantity)
-        offer.cycle = self.cycle
-        return offer
-
-    def __eq__(self, offer):
-        """Returns True iff all fields of this offer equal the other"""
-        return (self.player == offer.player and
-                self.quantity == offer.quantity)
-
 
 class Response(Action):
     """Response to an offer.
@@ -87,47 +164,169 @@ class Response(Action):
     offers or responses with these cards until this response is confirmed,
     withdrawn, or expired.
     """
+    __slots__ = ('offer', 'cards')
+
     def __init__(self, offer, player, cards):
-        """Game engine needs to know the cards so it can execute a trade. They
-        will be removed before the response is sent to the target player.
+        """Game engine needs to know the cards so it can execute a trade. Other
+        players are sent a copy of the response without them.
         """
         super(Response, self).__init__(player)
-        self.offer = offer
-        self.cards = cards
+        self._set(offer=offer, cards=cards)
 
     def __unicode__(self):
         return 'Response in cycle {2} by {0} to {1}'.format(
             self.player, self.offer, self.cycle)
 
-    def copy(self):
-        """Returns a copy of this response"""
-        response = Response(self.offer.copy(), self.player, self.cards)
-        response.cycle = self.cycle
-        return response
-
 
 class BellRing(Action):
     """The action of ringing the bell to indicate that you have won the round"""
+    __slots__ = ()
+
     def __unicode__(self):
         return 'Bell Ring in cycle {1} by {0}'.format(self.player, self.cycle)
 
 
+class OfferBook(object):
+    """The open offers in a round
+
+    Offers are indexed by id, so checking whether an offer is still open is a
+    single lookup. For expiry they are filed on a timing wheel under the cycle
+    in which they expire, so each cycle only the offers actually expiring are
+    looked at.
+    """
+    def __init__(self):
+        self.offers = {}
+        self.wheel = {}
+        self.expiry_cycles = []
+
+    def __len__(self):
+        return len(self.offers)
+
+    def __iter__(self):
+        return iter(sorted(self.offers.values(), key=lambda offer: offer.id))
+
+    def __contains__(self, offer):
+        return offer.id in self.offers
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def add(self, offer):
+        """Adds an offer, which must already have its id & cycle set
+
+        An offer added in cycle 0 gets to live through cycle <OFFER_CYCLES>
+        """
+        self.offers[offer.id] = offer
+        expiry_cycle = offer.cycle + OFFER_CYCLES + 1
+        if expiry_cycle not in self.wheel:
+            self.wheel[expiry_cycle] = []
+            heapq.heappush(self.expiry_cycles, expiry_cycle)
+        self.wheel[expiry_cycle].append(offer.id)
+
+    def get(self, offer_id):
+        """Returns the open offer with this id, or None"""
+        return self.offers.get(offer_id)
+
+    def remove(self, offer):
+        """Removes an offer, it is left on the wheel & skipped when expiring"""
+        del self.offers[offer.id]
+
+    def next_expiry(self):
+        """Returns the next cycle in which offers may expire, or None"""
+        return self.expiry_cycles[0] if self.expiry_cycles else None
+
+    def expire(self, cycle):
+        """Removes & returns offers that have expired by this cycle"""
+        expired = []
+        while self.expiry_cycles and self.expiry_cycles[0] <= cycle:
+            for offer_id in self.wheel.pop(heapq.heappop(self.expiry_cycles)):
+                offer = self.offers.get(offer_id)
+                if offer:
+                    self.remove(offer)
+                    expired.append(offer)
+        return expired
+
+
 class GameEngine(object):
-    def play(self, players, games=1):
-        """Primary entry method, plays a number of games of Pit"""
+    def __init__(self, fast_forward=False, batch_events=False, concurrent=False,
+                 max_round_cycles=None):
+        """fast_forward turns on skipping idle cycles, see one_cycle
+
+        batch_events turns on delivering notifications in batches, see notify
+
+        concurrent turns on hosting players in their own processes, see
+        collect_actions
+
+        max_round_cycles ends rounds that have gone on for that many cycles
+        without anyone winning, which are counted in stalled_rounds.
+        """
+        self.fast_forward = fast_forward
+        self.batch_events = batch_events
+        self.concurrent = concurrent
+        self.max_round_cycles = max_round_cycles
+        self.stalled_rounds = 0
+
+    def play(self, players, games=1, seed=None, profile=False):
+        """Primary entry method, plays a number of games of Pit
+
+        If a seed is given, each game is seeded on its own (see play_game) so
+        the results can be reproduced, including by pit.sync.tournament.
+
+        With profile=True, time spent in each player callback is recorded and
+        a report is printed at the end (see pit.sync.profiling).
+
+        In concurrent mode the players are replaced by proxies for the length
+        of play. The players passed in are left as they were. Profiling then
+        times the calls to the proxies, with get_action split in two (see
+        collect_actions & pit.sync.profiling).
+        """
         self.players = players
+        if self.concurrent:
+            self.players = remote.connect(players)
+        self.profiler = None
+        if profile:
+            self.profiler = profiling.Profiler()
+            self.profiler.instrument(self.players)
+        seats = dict(zip(self.players, players))
         results = dict([(player, 0) for player in players])
-        for game in range(games):
-            dealer = random.randint(0,len(players)-1)
-            winner = self.one_game(starting_dealer=dealer)
-            results[winner] += 1
+        try:
+            for game in range(games):
+                winner = self.play_game(game, seed)
+                results[seats[winner]] += 1
+        finally:
+            if self.profiler:
+                self.profiler.restore()
+            if self.concurrent:
+                for player in self.players:
+                    player.close()
+        if self.profiler:
+            print self.profiler.report()
         return results
 
+    def play_game(self, game, seed=None):
+        """Plays one game with a random starting dealer, returns winner
+
+        With a seed, the random module is reseeded from the seed and the game
+        number first, so the game plays out the same regardless of what was
+        played before it or in which process it runs. In concurrent mode,
+        each player's process is reseeded from the game seed & their seat.
+        """
+        if seed is not None:
+            random.seed(game_seed(seed, game))
+            if self.concurrent:
+                for seat, player in enumerate(self.players):
+                    player.seed((game_seed(seed, game), seat))
+        dealer = random.randint(0,len(self.players)-1)
+        return self.one_game(starting_dealer=dealer)
+
     def one_game(self, starting_dealer=0):
         """Play one game and returns winning player.
         """
         self.player_info = {}
         self.dealer = starting_dealer
+        # ids run on across rounds, so a response to an offer from an earlier
+        # round can't be mistaken for one to an open offer
+        self.action_ids = itertools.count()
         # so players can't edit and mess each other up
         players = tuple(self.players)
         for player in players:
@@ -145,8 +344,11 @@ class GameEngine(object):
         """
         self.cycle = 0
         self.in_play = True
-        self.offers = []
+        self.offers = OfferBook()
+        self.available = set(self.players)
         self.busy_players = {}
+        self.wakeups = {}
+        self.wakeup_cycles = []
 
         self.deal_cards()
         
@@ -154,17 +356,41 @@ class GameEngine(object):
         for player in self.players:
             card_counts[player] = len(self.player_info[player]['cards'])
 
+        self.interests = {}
+        self.subscribers = {}
+        self.seats = dict((player, seat) for seat, player in enumerate(self.players))
+        self.events = dict((player, []) for player in self.players)
         for player in self.players:
-            hand = copy.copy(self.player_info[player]['cards'])
+            hand = self.player_info[player]['cards'].to_list()
             player.new_round(hand, card_counts.copy())
+            self.update_interests(player)
 
         while self.in_play:
             self.one_cycle()
+            if (self.in_play and self.max_round_cycles is not None and
+                    self.cycle >= self.max_round_cycles):
+                self.in_play = False
+                self.stalled_rounds += 1
 
+        for player in self.players:
+            self.deliver_events(player)
         self.update_scores()
 
     def one_cycle(self):
-        """One cycle gives each player the chance to perform an action"""
+        """One cycle gives each player the chance to perform an action
+
+        In fast forward mode, when every player is busy the engine jumps
+        straight to the next cycle in which a player becomes available or an
+        offer expires, or the round hits max_round_cycles. Nothing can happen
+        in the cycles in between, so the game plays out exactly the same as
+        stepping through each of them.
+        """
+        if self.fast_forward and not self.available:
+            self.cycle = self.next_event_cycle()
+            if self.max_round_cycles is not None:
+                self.cycle = min(self.cycle, self.max_round_cycles)
+            self.end_cycle()
+            return
         actions = self.collect_actions()
         for action in actions:
             self.process_action(action)
@@ -174,13 +400,26 @@ class GameEngine(object):
         self.end_cycle()
 
     def collect_actions(self):
-        """Collects and randomizes player actions, locking cards as needed"""
+        """Collects and randomizes player actions, locking cards as needed
+
+        In concurrent mode every player is asked for an action before any
+        are collected, so they all work on their decisions at once.
+        """
         actions = []
         self.locked_cards = {}
-        for player in self.available_players():
-            action = player.get_action(self.cycle)
+        players = self.available_players()
+        if self.concurrent:
+            for player in players:
+                self.deliver_events(player)
+                player.request_action(self.cycle)
+        for player in players:
+            if self.concurrent:
+                action = player.action()
+            else:
+                self.deliver_events(player)
+                action = player.get_action(self.cycle)
             if action:
-                action.cycle = self.cycle
+                action = action.stamped(next(self.action_ids), self.cycle)
                 actions.append(action)
                 if isinstance(action, Response):
                     self.locked_cards[player] = action.cards
@@ -193,10 +432,10 @@ class GameEngine(object):
 
     def add_offer(self, offer):
         """Add an offer to the game"""
-        offer.cycle = self.cycle
-        self.offers.append(offer)
-        for player in self.available_players():
-            player.offer_made(offer.copy())
+        self.offers.add(offer)
+        for player in self.subscribers_for(offer.quantity):
+            if player in self.available:
+                self.notify(player, 'offer_made', offer)
         self.delay_player(offer.player, OFFER_DURATION)
 
 
@@ -212,22 +451,26 @@ class GameEngine(object):
         - offer no longer present in game state list of offers
         - player making response no longer has these cards
 
-        This also grabs the response's cards & removes them from the response.
-        They are saved so they can be used if the trade ends up executing.
+        This also grabs the response's cards. They are saved so they can be used
+        if the trade ends up executing, and players are sent a copy of the
+        response without them (referring to the engine's copy of the offer).
         """
-        response.cycle = self.cycle
         response_cards = response.cards
-        response.cards = None
+        offer = self.offers.get(response.offer.id)
+        response = Response(offer or response.offer, response.player, None
+                            ).stamped(response.id, response.cycle)
 
-        if (response.offer in self.offers and
-                response.player != response.offer.player and
+        if (offer is not None and
+                response.player != offer.player and
                 util.has_cards(response_cards, self.player_info[response.player]['cards'], [])):
-            confirm_cards = response.offer.player.response_made(response)
+            self.deliver_events(offer.player)
+            confirm_cards = offer.player.response_made(response)
             if (confirm_cards and
                   util.has_cards(confirm_cards, self.player_info[response.offer.player]['cards'], [])):
                 self.confirm(response, response_cards, confirm_cards)
                 return
         # player rejected response or offer was already removed
+        self.deliver_events(response.player)
         response.player.response_rejected(response)
         self.delay_player(response.player, RESPONSE_DURATION)
 
@@ -248,11 +491,13 @@ class GameEngine(object):
         # notify players of trade, send full hands to the two involved
         for player in self.players:
             if player == response.player:
-                player.trade_confirmation(response.copy(), hand=self.player_info[response.player]['cards'])
+                self.notify(player, 'trade_confirmation', response, self.player_info[response.player]['cards'].to_list())
             elif player == response.offer.player:
-                player.trade_confirmation(response.copy(), hand=self.player_info[response.offer.player]['cards'])
-            elif player in self.available_players():
-                player.trade_confirmation(response.copy(), hand=None)
+                self.notify(player, 'trade_confirmation', response, self.player_info[response.offer.player]['cards'].to_list())
+            elif self.is_available(player):
+                self.notify(player, 'trade_confirmation', response, None)
+        self.update_interests(response.player)
+        self.update_interests(response.offer.player)
 
         # the two players who trade are now busy for a bit
         self.delay_player(response.player, TRADE_DURATION)
@@ -261,11 +506,12 @@ class GameEngine(object):
     def ring_bell(self, bell_ring):
         """Ring the closing bell"""
         for player in self.players:
-            player.closing_bell(bell_ring.player)
+            self.notify(player, 'closing_bell', bell_ring.player)
 
         if util.is_winning_hand(self.player_info[bell_ring.player]['cards']):
             self.in_play = False
             for player in self.players:
+                self.deliver_events(player)
                 player.closing_bell_confirmed(bell_ring.player)
 
     ACTION_METHODS = {
@@ -288,49 +534,131 @@ class GameEngine(object):
         - removes any expired offers
         - restores busy players who are done being busy
         """
-        expired_offers = list(filter(
-            self.expired_offer, self.offers))
-        self.offers = list(itertools.ifilterfalse(
-            self.expired_offer, self.offers))
-        for offer in expired_offers:
-            offer.player.offer_expired(offer)
+        for offer in self.offers.expire(self.cycle):
+            self.notify(offer.player, 'offer_expired', offer)
+        self.wake_players()
 
-        for player in self.busy_players.keys():
-            if self.cycle >= self.busy_players[player]:
-                del self.busy_players[player]
+    def next_event_cycle(self):
+        """Returns the next cycle in which a player wakes up or offers expire
+        """
+        cycles = self.wakeup_cycles[:1]
+        if self.offers.next_expiry() is not None:
+            cycles.append(self.offers.next_expiry())
+        return max(self.cycle + 1, min(cycles)) if cycles else self.cycle + 1
 
-    def expired_offer(self, offer):
-        """True iff this offer is expired
+    def notify(self, player, callback, *args):
+        """Calls one of a player's notification callbacks
 
-        An offer added in cycle 0 gets to live through cycle <OFFER_CYCLES>
+        With batch_events the call is queued as an event, (callback, args),
+        for deliver_events instead.
         """
-        return self.cycle - offer.cycle > OFFER_CYCLES
+        if self.batch_events:
+            self.events[player].append((callback, args))
+        else:
+            getattr(player, callback)(*args)
+
+    def deliver_events(self, player):
+        """Sends a player the events queued for it, if any"""
+        events = self.events[player]
+        if events:
+            self.events[player] = []
+            player.events(events)
 
     def deal_cards(self):
         """Sets game_state cards to a new set of shuffled cards"""
         cards = util.deal_cards(len(self.players), self.dealer)
         for index, player in enumerate(self.players):
-            self.player_info[player]['cards'] = cards[index]
+            self.player_info[player]['cards'] = util.Hand(cards[index])
 
     def next_dealer(self):
         """Advances dealer"""
         self.dealer = util.next_position(self.dealer, len(self.players))
 
     def available_players(self):
-        """Returns iterable of players not currently busy"""
-        return set(self.players) - set(self.busy_players.keys())
+        """Returns iterable of players not currently busy
+
+        Players are kept in seating order so seeded games are reproducible.
+        """
+        return [player for player in self.players if player in self.available]
+
+    def update_interests(self, player):
+        """Asks a player which offer quantities it wants to hear about
+
+        Only the player's own entries in the subscriber index (see
+        subscribers_for) change: it's taken out of the lists for quantities it
+        no longer wants and put in its seat in those it now does.
+        """
+        self.deliver_events(player)
+        quantities = player.interests()
+        if quantities is not None:
+            quantities = frozenset(quantities)
+        if player in self.interests and self.interests[player] == quantities:
+            return
+        for quantity, subscribers in self.subscribers.iteritems():
+            wanted = self.is_interested(player, quantity)
+            wants = quantities is None or quantity in quantities
+            if wanted and not wants:
+                subscribers.remove(player)
+            elif wants and not wanted:
+                seat = self.seats[player]
+                index = 0
+                while (index < len(subscribers) and
+                       self.seats[subscribers[index]] < seat):
+                    index += 1
+                subscribers.insert(index, player)
+        self.interests[player] = quantities
+
+    def is_interested(self, player, quantity):
+        """Returns True if a player wants offers for this quantity of cards"""
+        quantities = self.interests.get(player, frozenset())
+        return quantities is None or quantity in quantities
+
+    def subscribers_for(self, quantity):
+        """Returns players interested in offers for this quantity of cards
+
+        In seating order, like available_players. The list for a quantity is
+        made the first time it's asked for, then kept up to date by
+        update_interests.
+        """
+        subscribers = self.subscribers.get(quantity)
+        if subscribers is None:
+            subscribers = self.subscribers[quantity] = [
+                player for player in self.players
+                if self.is_interested(player, quantity)]
+        return subscribers
+
+    def is_available(self, player):
+        """True iff this player is not currently busy"""
+        return player in self.available
 
     def delay_player(self, player, duration):
-        """Adds a player to busy_players for given number of cycles"""
+        """Adds a player to busy_players for given number of cycles
+
+        The player is also scheduled to wake up in the cycle the delay ends. If
+        they are delayed again before then, the earlier wake up is ignored.
+        """
         end_cycle = self.cycle + duration
         self.busy_players[player] = end_cycle
+        self.available.discard(player)
+        if end_cycle not in self.wakeups:
+            self.wakeups[end_cycle] = []
+            heapq.heappush(self.wakeup_cycles, end_cycle)
+        self.wakeups[end_cycle].append(player)
+
+    def wake_players(self):
+        """Makes players whose delay has ended available again"""
+        while self.wakeup_cycles and self.wakeup_cycles[0] <= self.cycle:
+            for player in self.wakeups.pop(heapq.heappop(self.wakeup_cycles)):
+                end_cycle = self.busy_players.get(player)
+                if end_cycle is not None and end_cycle <= self.cycle:
+                    del self.busy_players[player]
+                    self.available.add(player)
 
     def debug(self):
         """Helper to print game state and exit game"""
         print 'CYCLE {0}'.format(self.cycle)
         for player in self.players:
-            cards = copy.copy(self.player_info[player]['cards'])
-            cards.sort()
+            cards = self.player_info[player]['cards'].to_list()
             print 'PLAYER {0}: score={1} cards={2}'.format(
                 unicode(player), self.player_info[player]['score'], cards)
         print 'OFFERS {0}'.format(self.offers)
@@ -23,6 +23,23 @@ class Player(object):
     def get_action(self, cycle):
         """Return an action for the current cycle or None to pass"""
 
+    def interests(self):
+        """Return the offer quantities you want to hear about, None for all
+
+        Asked whenever your hand changes (new round or trade). You will only be
+        sent offers (offer_made) for these quantities until you're asked again.
+        """
+
+    def events(self, events):
+        """Notifications held back for you when events are batched
+
+        A list of (callback, args) tuples in the order they happened, e.g.
+        ('offer_made', (offer,)). This calls the callbacks one at a time,
+        override it to handle them all at once.
+        """
+        for callback, args in events:
+            getattr(self, callback)(*args)
+
     def offer_made(self, offer):
         """A player has called out an offer for anyone to respond"""
 
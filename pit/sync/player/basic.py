@@ -61,6 +61,20 @@ class BasicPlayer(base.Player):
 
         return self._make_offer()
 
+    def interests(self):
+        """Returns the offer quantities _matching_cards could match"""
+        self._group_cards()
+        extra = (config.BULL in self.hand) + (config.BEAR in self.hand)
+        quantities = set()
+        for commodity, quantity in self.card_groups.iteritems():
+            quantities.add(quantity)
+            if commodity not in [config.BULL, config.BEAR]:
+                if extra:
+                    quantities.add(quantity+1)
+                if extra == 2:
+                    quantities.add(quantity+2)
+        return quantities
+
     def offer_made(self, offer):
         """A player has called out an offer for anyone to respond"""
         if offer.player != self:
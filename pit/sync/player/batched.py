@@ -0,0 +1,185 @@
+"""Batched player(s) for the vectorized engine in pit.sync.batched
+"""
+import itertools
+
+import numpy as np
+
+from pit import config, util
+from pit.sync import batched
+from pit.sync.player import basic
+
+
+class BatchedPlayer(object):
+    """Base class for players of batched.BatchedGameEngine
+
+    A batched player sits in one seat at every table and picks the actions
+    for that seat at many tables at once. It reads whatever game state it
+    needs straight from the engine's arrays (its own hand, offers it was
+    notified of, etc.) and should use engine.random for any randomness so
+    seeded runs are reproducible.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def get_actions(self, engine, seat, rows):
+        """Returns actions for this seat at the given tables
+
+        Returns a tuple of arrays (kinds, quantities, offerers, cards), one
+        entry per table: the action kind (batched.PASS, OFFER, RESPONSE or
+        BELL), the offer quantity for offers & responses, the player who made
+        the offer being responded to, and the cards (as counts per card type)
+        for responses. This one always passes.
+        """
+        size = rows.size
+        return (np.zeros(size, dtype=int),
+                np.zeros(size, dtype=int),
+                np.zeros(size, dtype=int),
+                np.zeros((size, batched.NUM_CARDS), dtype=int))
+
+    def response_made(self, engine, seat, rows, quantities):
+        """Players have responded to this seat's offers at the given tables
+
+        Returns (cards, accepted) where cards are the cards to trade as counts
+        per card type and accepted is False where the response is rejected.
+        This one rejects everything.
+        """
+        return (np.zeros((rows.size, batched.NUM_CARDS), dtype=int),
+                np.zeros(rows.size, dtype=bool))
+
+    def __unicode__(self):
+        return self.name
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+    def __repr__(self):
+        return unicode(self).encode('utf-8')
+
+
+# BasicPlayer's ways of matching an offer with a group of one card type, in
+# order of preference: exactly the quantity, or a commodity topped up with the
+# bull, the bear, or both
+NO_MATCH, EXACT, WITH_BULL, WITH_BEAR, WITH_BOTH = range(5)
+
+
+def _match_key(hands):
+    """Returns lookup key for each card type of each hand
+
+    The key combines the count of the card with whether the hand holds the
+    bull and the bear and whether the card is a commodity.
+    """
+    bull = np.minimum(hands[..., util.BULL_INDEX], 1)[..., None]
+    bear = np.minimum(hands[..., util.BEAR_INDEX], 1)[..., None]
+    return hands * 8 + bull * 4 + bear * 2 + IS_COMMODITY
+
+
+def _match_table():
+    """Builds the rules lookup table, indexed by [_match_key, quantity]"""
+    table = np.zeros(((config.COMMODITIES_PER_HAND + 2) * 8,
+                      batched.MAX_QUANTITY + 1), dtype=int)
+    for key, quantity in itertools.product(range(8, table.shape[0]),
+                                           range(1, table.shape[1])):
+        count, bull, bear, commodity = key // 8, key & 4, key & 2, key & 1
+        if count == quantity:
+            rule = EXACT
+        elif commodity and bull and count + 1 == quantity:
+            rule = WITH_BULL
+        elif commodity and bear and count + 1 == quantity:
+            rule = WITH_BEAR
+        elif commodity and bull and bear and count + 2 == quantity:
+            rule = WITH_BOTH
+        else:
+            rule = NO_MATCH
+        table[key, quantity] = rule
+    return table
+
+IS_COMMODITY = (np.arange(batched.NUM_CARDS) < util.NUM_COMMODITIES).astype(int)
+MATCH_TABLE = _match_table()
+# bit q set if a card type can be used to match an offer for q cards
+QUANTITY_BITS = ((MATCH_TABLE != NO_MATCH) <<
+                 np.arange(batched.MAX_QUANTITY + 1)).sum(axis=1)
+
+
+def matching_quantities(hands):
+    """Returns (hands, 4) bool array of offer quantities the hands can match"""
+    bits = np.bitwise_or.reduce(QUANTITY_BITS[_match_key(hands)], axis=-1)
+    quantities = np.arange(1, batched.MAX_QUANTITY + 1)
+    return (bits[:, None] >> quantities) & 1 == 1
+
+
+def matching_cards(hands, quantities, random):
+    """Vectorized BasicPlayer._matching_cards
+
+    Picks a random card type that can make up each quantity, returns
+    (cards, found) with cards as counts per card type.
+    """
+    rules = MATCH_TABLE[_match_key(hands), quantities[:, None]]
+    card, found = batched.random_choice(rules != NO_MATCH, random)
+    index = np.arange(hands.shape[0])
+    rule = rules[index, card]
+
+    cards = np.zeros_like(hands)
+    cards[index, card] = np.where(rule == EXACT, quantities, hands[index, card])
+    cards[:, util.BULL_INDEX] += (rule == WITH_BULL) | (rule == WITH_BOTH)
+    cards[:, util.BEAR_INDEX] += (rule == WITH_BEAR) | (rule == WITH_BOTH)
+    cards[~found] = 0
+    return cards, found
+
+
+class BatchedBasicPlayer(BatchedPlayer):
+    """Batched port of basic.BasicPlayer
+
+    Makes the same decisions as BasicPlayer with the same probabilities: pass
+    one time in five, ring the bell with a winning hand, respond to a random
+    matchable offer made in the last OFFER_EXPIRATION cycles, else make a
+    random offer for a quantity it doesn't already have an offer out for.
+    """
+    OFFER_EXPIRATION = basic.BasicPlayer.OFFER_EXPIRATION
+
+    def get_actions(self, engine, seat, rows):
+        """Returns actions for this seat at the given tables"""
+        random = engine.random
+        size = rows.size
+        kinds, quantities, offerers, cards = super(
+            BatchedBasicPlayer, self).get_actions(engine, seat, rows)
+        hands = engine.hands[rows, seat]
+
+        # randomly do nothing just to mix it up
+        acting = random.randint(0, 5, size) != 4
+
+        bell = acting & batched.is_winning(hands)
+        kinds[bell] = batched.BELL
+
+        # respond to a random offer that can be matched
+        notified = engine.notified[rows, seat]
+        age = engine.cycle[rows][:, None, None] - notified
+        live = (notified >= 0) & (age <= self.OFFER_EXPIRATION)
+        options = (live & matching_quantities(hands)[:, None, :] &
+                   (acting & ~bell)[:, None, None])
+        choice, found = batched.random_choice(options.reshape(size, -1), random)
+        index = np.flatnonzero(found)
+        offerer, slot = np.divmod(choice[index], batched.MAX_QUANTITY)
+        response_cards, _ = matching_cards(hands[index], slot + 1, random)
+        kinds[index] = batched.RESPONSE
+        quantities[index] = slot + 1
+        offerers[index] = offerer
+        cards[index] = response_cards
+        # like BasicPlayer, forget about offers once responded to
+        engine.notified[rows[index], seat, offerer, slot] = -1
+
+        # otherwise make an offer for a quantity not already offered
+        index = np.flatnonzero(acting & ~bell & ~found)
+        counts = hands[index]
+        my_offers = engine.offers[rows[index], seat]
+        offered = my_offers[np.arange(index.size)[:, None],
+                            np.clip(counts - 1, 0, batched.MAX_QUANTITY - 1)] >= 0
+        options = (counts >= 1) & (counts <= batched.MAX_QUANTITY) & ~offered
+        card, found = batched.random_choice(options, random)
+        index, card = index[found], card[found]
+        kinds[index] = batched.OFFER
+        quantities[index] = hands[index, card]
+        return kinds, quantities, offerers, cards
+
+    def response_made(self, engine, seat, rows, quantities):
+        """Accepts responses when cards matching the quantity are available"""
+        return matching_cards(engine.hands[rows, seat], quantities, engine.random)
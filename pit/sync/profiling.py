@@ -0,0 +1,226 @@
+"""Optional profiling of player callbacks in the synchronous game engine
+
+A Profiler wraps each player's callback methods (get_action, offer_made, etc.)
+with timing wrappers set directly on the player instances, so the engine calls
+them exactly as before and there is no cost at all when profiling is off. It
+records call counts and wall time per player per callback, and works out the
+time spent in the engine itself as whatever is left over. Callbacks called from
+other callbacks (e.g. by Player.events) count towards both, but only once
+towards the total time spent in players.
+
+Times are read from the monotonic clock where possible (see get_timer), which
+has far finer resolution than time.time, less the time taken to read it. The
+clock is picked the first time a Profiler is made, not on import.
+
+With GameEngine(concurrent=True), players are proxies that split get_action in
+two (see pit.sync.remote), so request_action & action are timed in its place;
+action includes any time spent waiting for that player to decide.
+
+Use GameEngine.play(players, profile=True) to print a report at the end of
+play, or create a Profiler and call instrument/restore yourself.
+"""
+import ctypes
+import ctypes.util
+import math
+import sys
+import time
+
+
+# player methods called by the game engine
+CALLBACKS = [
+    'new_game',
+    'new_round',
+    'get_action',
+    'interests',
+    'events',
+    'offer_made',
+    'offer_expired',
+    'response_made',
+    'response_rejected',
+    'trade_confirmation',
+    'closing_bell',
+    'closing_bell_confirmed',
+]
+
+# methods that stand in for get_action on pit.sync.remote.RemotePlayers
+REMOTE_CALLBACKS = [
+    'request_action',
+    'action',
+]
+
+# durations are kept in a histogram with buckets this factor apart
+BUCKET_BASE = 1.1
+
+# clock id of CLOCK_MONOTONIC on Linux (other platforms number them differently)
+CLOCK_MONOTONIC = 1
+
+# the timer picked by get_timer
+_timer = None
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _monotonic_timer():
+    """Returns a function reading CLOCK_MONOTONIC in seconds, or None
+
+    Only on Linux, where the clock id is known, and only if the C library's
+    clock_gettime can be found and read without any error.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        library = ctypes.util.find_library('c')
+        if library is None:
+            return None
+        clock_gettime = ctypes.CDLL(library).clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        now = _Timespec()
+        ref = ctypes.byref(now)
+        if clock_gettime(CLOCK_MONOTONIC, ref) != 0:
+            return None
+    except Exception:
+        return None
+    def monotonic():
+        clock_gettime(CLOCK_MONOTONIC, ref)
+        return now.tv_sec + now.tv_nsec * 1e-9
+    return monotonic
+
+
+def get_timer():
+    """Returns a function giving the time in seconds, for durations only
+
+    That's time.perf_counter where there is one, else the monotonic clock on
+    Linux, else time.time. Picked the first time this is called.
+    """
+    global _timer
+    if _timer is None:
+        _timer = (getattr(time, 'perf_counter', None) or _monotonic_timer() or
+                  time.time)
+    return _timer
+
+
+def timer_overhead(samples=1000):
+    """Returns the least time measured between two back to back timer reads"""
+    timer = get_timer()
+    overhead = None
+    for _ in range(samples):
+        start = timer()
+        duration = timer() - start
+        if overhead is None or duration < overhead:
+            overhead = duration
+    return overhead
+
+
+class Timings(object):
+    """Call count and durations for one player callback
+
+    Percentiles are read from a log-scale histogram, so memory stays fixed
+    no matter how many calls are recorded and they are accurate to within
+    BUCKET_BASE.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, duration):
+        """Records one call"""
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        bucket = (int(math.floor(math.log(duration, BUCKET_BASE)))
+                  if duration > 0 else None)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent):
+        """Returns the duration that percent of calls took no longer than"""
+        target = self.count * percent / 100.0
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda b: (b is not None, b)):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return 0.0 if bucket is None else min(
+                    BUCKET_BASE ** (bucket + 1), self.max)
+        return self.max
+
+
+class Profiler(object):
+    """Records time spent in each player's callbacks"""
+    def __init__(self):
+        self.timer = get_timer()
+        self.timings = {}
+        self.players = []
+        self.depth = 0
+        self.callback_time = 0.0
+        self.overhead = 0.0
+        self.start_time = self.end_time = None
+
+    def callbacks(self, player):
+        """Returns names of the player's methods to time"""
+        return CALLBACKS + [name for name in REMOTE_CALLBACKS
+                            if hasattr(player, name)]
+
+    def instrument(self, players):
+        """Wraps player callbacks with timers & starts the clock"""
+        self.overhead = timer_overhead()
+        self.players = list(players)
+        for player in self.players:
+            for name in self.callbacks(player):
+                timings = self.timings.setdefault((player.name, name), Timings())
+                setattr(player, name, self._timed(getattr(player, name), timings))
+        self.start_time = self.timer()
+
+    def restore(self):
+        """Removes the wrappers added by instrument & stops the clock"""
+        self.end_time = self.timer()
+        for player in self.players:
+            for name in self.callbacks(player):
+                del player.__dict__[name]
+        self.players = []
+
+    def _timed(self, method, timings):
+        """Returns wrapper around method that adds each call to timings"""
+        timer = self.timer
+        def timed(*args, **kwargs):
+            start = timer()
+            self.depth += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                duration = max(0.0, timer() - start - self.overhead)
+                timings.add(duration)
+                self.depth -= 1
+                if not self.depth:
+                    self.callback_time += duration
+        return timed
+
+    def player_time(self):
+        """Total seconds spent in player callbacks"""
+        return self.callback_time
+
+    def engine_time(self):
+        """Seconds spent in the engine itself, outside player callbacks"""
+        end_time = self.end_time or self.timer()
+        return end_time - self.start_time - self.player_time()
+
+    def report(self):
+        """Returns a printable summary of the timings"""
+        row = '{0:<12} {1:<24} {2:>9} {3:>10} {4:>9} {5:>9} {6:>9} {7:>9}'
+        lines = [row.format('PLAYER', 'CALLBACK', 'CALLS', 'TOTAL MS',
+                            'MEAN US', 'P50 US', 'P90 US', 'P99 US')]
+        for (player, name), timings in sorted(self.timings.items()):
+            if not timings.count:
+                continue
+            lines.append(row.format(
+                player, name, timings.count,
+                '{0:.1f}'.format(timings.total * 1e3),
+                '{0:.1f}'.format(timings.total / timings.count * 1e6),
+                '{0:.1f}'.format(timings.percentile(50) * 1e6),
+                '{0:.1f}'.format(timings.percentile(90) * 1e6),
+                '{0:.1f}'.format(timings.percentile(99) * 1e6)))
+        lines.append('PLAYERS {0:.1f} MS, ENGINE {1:.1f} MS'.format(
+            self.player_time() * 1e3, self.engine_time() * 1e3))
+        return '\n'.join(lines)
@@ -0,0 +1,210 @@
+"""Sync players hosted in worker processes
+
+GameEngine(concurrent=True) hosts each player in its own process, behind a
+RemotePlayer proxy that implements the Player interface by forwarding calls
+over a Pipe. Notifications are sent without waiting; calls that return
+something (get_action, response_made, interests) wait for the answer. The
+engine asks every available player for its action first (request_action) and
+only then collects them (action), so all players decide at once and a cycle
+takes about as long as the slowest player rather than all of them in turn.
+That only pays off for players that think for a while, for quick players like
+BasicPlayer the round trips cost more than they save.
+
+Players and actions keep their identity across the pipe: references to
+players are sent as their names (which must be unique, see Player.__eq__) and
+resolved to the proxies on the engine's side and to the hosted player or a
+stand in Seat on the player's side. An action sent back to the player who made
+it is their very own instance, stamped with the engine's id & cycle.
+
+Each process has its own random module, so seeded games are still
+reproducible (each player is reseeded for every game, see RemotePlayer.seed)
+but don't play out the same as with in-process players.
+"""
+import cPickle
+import cStringIO
+import multiprocessing
+import random
+import traceback
+
+from pit.sync.player import base
+
+
+class PlayerError(Exception):
+    """A hosted player raised an exception, the message is its traceback"""
+
+
+def dumps(obj, persistent_id):
+    """Pickles obj, with references resolved by persistent_id"""
+    buf = cStringIO.StringIO()
+    pickler = cPickle.Pickler(buf, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(obj)
+    return buf.getvalue()
+
+
+def loads(data, persistent_load):
+    """Unpickles data, with references resolved by persistent_load"""
+    unpickler = cPickle.Unpickler(cStringIO.StringIO(data))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+
+class Seat(base.Player):
+    """Stands in for another player in a hosted player's process"""
+    def __init__(self, name):
+        self.name = name
+
+
+class Host(object):
+    """Runs a player in a worker process, see RemotePlayer"""
+    def __init__(self, player, conn):
+        self.player = player
+        self.conn = conn
+        self.seats = {player.name: player}
+        # actions returned to the engine, by token
+        self.outgoing = {}
+        self.error = None
+
+    def persistent_id(self, obj):
+        if obj is self.player or isinstance(obj, Seat):
+            return ('player', obj.name)
+
+    def persistent_load(self, pid):
+        if pid[0] == 'player':
+            if pid[1] not in self.seats:
+                self.seats[pid[1]] = Seat(pid[1])
+            return self.seats[pid[1]]
+        _, token, action_id, cycle = pid
+        action = self.outgoing[token]
+        if action.id is None:
+            action._set(id=action_id, cycle=cycle)
+        return action
+
+    def run(self):
+        """Calls the player as asked by the proxy until closed
+
+        An exception from a call that isn't waited on is kept and sent back
+        with the answer to the next call that is.
+        """
+        while True:
+            method, args, reply = loads(self.conn.recv_bytes(), self.persistent_load)
+            if method is None:
+                break
+            if method == 'new_round':
+                self.outgoing = {}
+            result = token = None
+            try:
+                target = self if method == 'seed' else self.player
+                result = getattr(target, method)(*args)
+            except Exception:
+                self.error = self.error or traceback.format_exc()
+            if not reply:
+                continue
+            if result is not None and method == 'get_action':
+                token = len(self.outgoing)
+                self.outgoing[token] = result
+            self.conn.send_bytes(dumps((self.error, token, result), self.persistent_id))
+            self.error = None
+
+    def seed(self, value):
+        """Reseeds the random module of the player's process"""
+        random.seed(value)
+
+
+def host(player, conn):
+    """Worker process entry point"""
+    Host(player, conn).run()
+
+
+class RemotePlayer(base.Player):
+    """Proxy for a player hosted in its own process
+
+    Use connect to create the proxies for all the players at a table, as
+    they need to know about each other.
+    """
+    # calls that wait for & return the player's answer
+    REPLIES = ['get_action', 'response_made', 'interests']
+
+    def __init__(self, player, table):
+        self.name = player.name
+        self.player = player
+        self.table = table
+        # actions the player made, by id(), with their tokens
+        self.outgoing = {}
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.proc = multiprocessing.Process(target=host, args=(player, child_conn))
+        self.proc.daemon = True
+        self.proc.start()
+
+    def persistent_id(self, obj):
+        if isinstance(obj, RemotePlayer):
+            return ('player', obj.name)
+        if id(obj) in self.outgoing:
+            token, action = self.outgoing[id(obj)]
+            return ('action', token, action.id, action.cycle)
+
+    def persistent_load(self, pid):
+        return self.table[pid[1]]
+
+    def call(self, method, *args):
+        """Calls a method of the player, without waiting unless it replies"""
+        reply = method in self.REPLIES
+        self.conn.send_bytes(dumps((method, args, reply), self.persistent_id))
+        if reply:
+            return self.answer()
+
+    def answer(self):
+        """Waits for & returns the answer to the last call"""
+        error, token, result = loads(self.conn.recv_bytes(), self.persistent_load)
+        if error:
+            raise PlayerError(error)
+        if token is not None:
+            self.outgoing[id(result)] = (token, result)
+        return result
+
+    def request_action(self, cycle):
+        """First half of get_action, asks the player for an action"""
+        self.conn.send_bytes(dumps(('get_action', (cycle,), True), self.persistent_id))
+
+    def action(self):
+        """Second half of get_action, returns the action asked for"""
+        return self.answer()
+
+    def get_action(self, cycle):
+        self.request_action(cycle)
+        return self.action()
+
+    def new_round(self, hand, card_counts):
+        self.outgoing = {}
+        self.call('new_round', hand, card_counts)
+
+    def seed(self, value):
+        """Reseeds the random module of the player's process"""
+        self.call('seed', value)
+
+    def close(self):
+        """Ends the player's process"""
+        self.conn.send_bytes(dumps((None, (), False), self.persistent_id))
+        self.proc.join()
+
+
+def _forward(method):
+    def forward(self, *args):
+        return self.call(method, *args)
+    forward.__name__ = method
+    forward.__doc__ = getattr(base.Player, method).__doc__
+    return forward
+
+for _method in ['new_game', 'opening_bell', 'interests', 'events',
+                'offer_made', 'offer_expired', 'response_made',
+                'response_rejected', 'trade_confirmation', 'closing_bell',
+                'closing_bell_confirmed']:
+    setattr(RemotePlayer, _method, _forward(_method))
+
+
+def connect(players):
+    """Starts a process for each player, returns a RemotePlayer for each"""
+    table = {}
+    for player in players:
+        table[player.name] = RemotePlayer(player, table)
+    return [table[player.name] for player in players]
@@ -0,0 +1,68 @@
+"""Runs a large number of synchronous Pit games across multiple processes
+
+Games are split into chunks and handed to a multiprocessing Pool. Each worker
+process builds its own GameEngine and gets its own copy of the players, then
+plays every game it is given with that game's own seed (see
+GameEngine.play_game). Because the seed depends only on the base seed and the
+game number, the combined results are the same no matter how many workers are
+used or which worker plays which game.
+
+Players are copied into the workers (pickled where fork is not available) and
+should reset any state they depend on in new_game/new_round.
+"""
+import multiprocessing
+
+from pit.sync import gameengine
+
+
+# number of games sent to a worker at a time
+CHUNK_SIZE = 25
+
+# engine & players for the current worker process, set up by _init_worker
+_worker = {}
+
+
+def play(players, games=1, processes=None, seed=0, chunk_size=CHUNK_SIZE,
+         max_round_cycles=gameengine.MAX_ROUND_CYCLES):
+    """Plays games spread across a pool of processes
+
+    Returns a dict of wins keyed by player, the same as GameEngine.play.
+    processes defaults to the number of CPUs. Rounds are ended without a
+    winner after max_round_cycles (see GameEngine), so players that get stuck
+    can't hang the whole tournament; pass None to play every round out.
+    """
+    chunks = [range(start, min(start + chunk_size, games))
+              for start in range(0, games, chunk_size)]
+    wins = [0] * len(players)
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (players, seed, max_round_cycles))
+    try:
+        for chunk_wins in pool.imap_unordered(_play_games, chunks):
+            for position, count in enumerate(chunk_wins):
+                wins[position] += count
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(players, wins))
+
+
+def _init_worker(players, seed, max_round_cycles):
+    """Sets up the engine & players for one worker process"""
+    engine = gameengine.GameEngine(max_round_cycles=max_round_cycles)
+    engine.players = players
+    _worker.update({
+        'engine': engine,
+        'positions': dict((id(player), position)
+                          for position, player in enumerate(players)),
+        'seed': seed,
+    })
+
+
+def _play_games(games):
+    """Plays the given game numbers, returns list of wins by player position"""
+    engine = _worker['engine']
+    wins = [0] * len(engine.players)
+    for game in games:
+        winner = engine.play_game(game, _worker['seed'])
+        wins[_worker['positions'][id(winner)]] += 1
+    return wins
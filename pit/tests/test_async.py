@@ -0,0 +1,487 @@
+"""Unit tests for the async game engine"""
+import collections
+import mock
+import threading
+import time
+import unittest
+
+from pit import config, util
+from pit.async import clocks, transport
+from pit.async.gameengine import (Barrier, BindingOffers, ExpiryWheel,
+                                  GameEngine, Message)
+from pit.async.player import base, basic
+from pit.async.player.base import NullPlayer
+
+
+class MessageTest(unittest.TestCase):
+    """Tests for encoding messages in the binary wire format"""
+    def assertRoundTrip(self, message):
+        """Asserts a message decodes to what was encoded"""
+        decoded = Message.decode(message.encode())
+        self.assertEqual(decoded.__dict__, message.__dict__)
+
+    def test_round_trip(self):
+        """Every verb & field survives encoding"""
+        for verb in Message.VERBS:
+            self.assertRoundTrip(Message(verb))
+        self.assertRoundTrip(Message(Message.OFFER, uid=1, count=3, epoch=7))
+        self.assertRoundTrip(Message(
+            Message.TRADE, uid=2 ** 40, target_uid=3, epoch=2 ** 32 - 1,
+            cards=[config.COMMODITIES[0], config.BULL],
+            removed_cards=[config.BEAR, config.COMMODITIES[-1]]))
+
+    def test_ttl(self):
+        """Binding offer ttls are sent to the millisecond, up to MAX_TTL"""
+        cards = [config.COMMODITIES[1]] * 2
+        for ttl in [.001, .25, Message.MAX_TTL]:
+            self.assertRoundTrip(Message(Message.BINDING_OFFER, uid=1,
+                                         cards=cards, target_uid=2, ttl=ttl))
+        decoded = Message.decode(Message(Message.BINDING_OFFER, ttl=1e-4).encode())
+        self.assertEqual(decoded.ttl, .001)
+        for ttl in [0, -1, Message.MAX_TTL + .001]:
+            self.assertRaises(ValueError, Message, Message.BINDING_OFFER, ttl=ttl)
+
+    def test_epoch_of(self):
+        """The epoch can be read without decoding"""
+        data = Message(Message.RING_BELL, uid=5, epoch=12345).encode()
+        self.assertEqual(Message.epoch_of(data), 12345)
+
+    def test_batch(self):
+        """Batches decode to their messages in order, single messages too"""
+        messages = [Message(Message.OFFER, uid=uid, count=uid, epoch=1)
+                    for uid in range(1, 4)]
+        messages.append(Message(Message.WITHDRAW, uid=4, target_uid=1,
+                                cards=[config.BEAR], epoch=1))
+        data = Message.encode_batch([message.encode() for message in messages])
+        self.assertEqual([decoded.__dict__ for decoded in Message.decode_all(data)],
+                         [message.__dict__ for message in messages])
+        self.assertEqual(Message.decode_all(Message.encode_batch([])), [])
+        single = Message.decode_all(messages[0].encode())
+        self.assertEqual([decoded.__dict__ for decoded in single],
+                         [messages[0].__dict__])
+
+
+class OpenOfferLimitTest(unittest.TestCase):
+    """Tests for dropping repeated open offers & limiting their rate"""
+    def make_engine(self, **kwargs):
+        """Returns an engine on a virtual clock, with one player & no sending"""
+        engine = GameEngine(clock=clocks.VirtualClock(), **kwargs)
+        engine.broadcast = mock.Mock()
+        engine.player_data = {1: {
+            'dropped': collections.Counter(),
+            'allowance': engine.max_allowance,
+            'allowance_time': 0.,
+            'live_offers': {},
+        }}
+        return engine
+
+    def offer(self, engine, count=1, times=1):
+        """Sends open offers from the player, returns how many went out"""
+        sent = engine.broadcast.call_count
+        for _ in range(times):
+            engine.process_offer(Message(Message.OFFER, uid=1, count=count))
+        return engine.broadcast.call_count - sent
+
+    def test_no_limits(self):
+        """Without limits every offer is rebroadcast"""
+        engine = self.make_engine()
+        self.assertEqual(self.offer(engine, times=10), 10)
+        self.assertEqual(engine.player_data[1]['dropped'], {})
+
+    def test_rate_limit(self):
+        """Offers over the rate are dropped, bursts are up to a second's worth"""
+        engine = self.make_engine(rate_limit=2)
+        self.assertEqual(self.offer(engine, times=3), 2)
+        engine.clock.advance(.5)
+        self.assertEqual(self.offer(engine, times=2), 1)
+        engine.clock.advance(10)
+        self.assertEqual(self.offer(engine, times=3), 2)
+        self.assertEqual(engine.player_data[1]['dropped'],
+                         {GameEngine.RATE_LIMITED: 3})
+
+    def test_slow_rate_limit(self):
+        """Under one offer a second, an offer goes out as soon as it's due"""
+        engine = self.make_engine(rate_limit=.5)
+        self.assertEqual(self.offer(engine, times=2), 1)
+        engine.clock.advance(1.5)
+        self.assertEqual(self.offer(engine), 0)
+        engine.clock.advance(.5)
+        self.assertEqual(self.offer(engine, times=2), 1)
+        engine.clock.advance(60)
+        self.assertEqual(self.offer(engine, times=2), 1)
+
+    def test_duplicates(self):
+        """Repeats of the live offer for a count are dropped until offer_ttl"""
+        engine = self.make_engine(offer_ttl=1)
+        self.assertEqual(self.offer(engine, count=2, times=3), 1)
+        self.assertEqual(self.offer(engine, count=3), 1)
+        engine.clock.advance(.5)
+        self.assertEqual(self.offer(engine, count=2), 0)
+        engine.clock.advance(.5)
+        self.assertEqual(self.offer(engine, count=2, times=2), 1)
+        self.assertEqual(engine.player_data[1]['dropped'],
+                         {GameEngine.DUPLICATE: 4})
+
+    def test_duplicates_not_rate_limited(self):
+        """Dropped duplicates don't use up the rate limit"""
+        engine = self.make_engine(offer_ttl=1, rate_limit=2)
+        self.assertEqual(self.offer(engine, count=2, times=5), 1)
+        self.assertEqual(self.offer(engine, count=3), 1)
+        self.assertEqual(self.offer(engine, count=4), 0)
+        self.assertEqual(engine.player_data[1]['dropped'],
+                         {GameEngine.DUPLICATE: 4, GameEngine.RATE_LIMITED: 1})
+
+
+class BatchingTest(unittest.TestCase):
+    """Tests for coalescing what players send & batching what they're sent"""
+    def setUp(self):
+        """Sets up an engine in a round with three players, on a Channel"""
+        self.engine = GameEngine(clock=clocks.VirtualClock())
+        self.engine.epoch = 1
+        self.engine.round_winner = None
+        self.engine.outboxes = None
+        self.engine.message_queue = transport.Channel()
+        self.engine.player_data = dict((uid, {
+            'conn': mock.Mock(),
+            'max_batch': GameEngine.MAX_BATCH_SIZE,
+            'dropped': collections.Counter(),
+            'allowance': None,
+            'allowance_time': 0.,
+            'live_offers': {},
+        }) for uid in [1, 2, 3])
+
+    def put(self, *messages):
+        """Queues messages from players for the engine"""
+        for message in messages:
+            message.epoch = 1
+            self.engine.message_queue.put(message.encode())
+
+    def sent(self, uid):
+        """Returns the list of byte strings sent to a player"""
+        conn = self.engine.player_data[uid]['conn']
+        return [args[0] for args, _ in conn.send_bytes.call_args_list]
+
+    def test_coalesce(self):
+        """Open offers & withdraws repeated within a tick are only kept once"""
+        cards = [config.COMMODITIES[0]]
+        messages = [Message(Message.OFFER, uid=1, count=2),
+                    Message(Message.WITHDRAW, uid=1, target_uid=2, cards=cards),
+                    Message(Message.OFFER, uid=1, count=3),
+                    Message(Message.OFFER, uid=1, count=2),
+                    Message(Message.OFFER, uid=2, count=2),
+                    Message(Message.WITHDRAW, uid=1, target_uid=2, cards=cards),
+                    Message(Message.RING_BELL, uid=2),
+                    Message(Message.RING_BELL, uid=2)]
+        self.assertEqual(self.engine.coalesce(messages),
+                         [messages[index] for index in [0, 1, 2, 4, 6, 7]])
+
+    def test_replaced_offer(self):
+        """An open offer made again within a tick is only rebroadcast once"""
+        self.put(Message(Message.OFFER, uid=1, count=2),
+                 Message(Message.OFFER, uid=1, count=3),
+                 Message(Message.OFFER, uid=1, count=2))
+        self.engine.tick(0)
+        sent = [(message.uid, message.count)
+                for data in self.sent(3) for message in Message.decode_all(data)]
+        self.assertEqual(sent, [(1, 2), (1, 3)])
+        self.assertEqual(self.sent(1), [])
+
+    def test_flush(self):
+        """Everything sent to a player in a tick goes in a single message"""
+        self.put(Message(Message.OFFER, uid=1, count=1),
+                 Message(Message.OFFER, uid=2, count=2),
+                 Message(Message.OFFER, uid=1, count=3))
+        self.engine.tick(0)
+        self.assertEqual(len(self.sent(3)), 1)
+        messages = Message.decode_all(self.sent(3)[0])
+        self.assertEqual([message.count for message in messages], [1, 2, 3])
+        # a single message is sent as is, not as a batch of one
+        self.assertEqual(Message.decode(self.sent(1)[0]).count, 2)
+
+    def test_flush_max_batch(self):
+        """Batches are split so none is over the player's max_batch"""
+        datas = [Message(Message.OFFER, uid=1, count=count).encode()
+                 for count in range(1, 5)]
+        item_size = Message.BATCH_LENGTH.size + len(datas[0])
+        self.engine.player_data[2]['max_batch'] = 1 + 2 * item_size
+        self.engine.flush(2, datas)
+        self.assertEqual([len(Message.unbatch(data)) for data in self.sent(2)], [2, 2])
+        self.assertEqual([item for data in self.sent(2) for item in Message.unbatch(data)],
+                         datas)
+
+
+class ExpiryWheelTest(unittest.TestCase):
+    """Tests for filing binding offers by when they expire"""
+    def test_expire(self):
+        """Offers come off the wheel once their tick is reached, in order"""
+        wheel = ExpiryWheel()
+        self.assertEqual(wheel.next_expiry(), None)
+        wheel.add('b', .0025)
+        wheel.add('a', .001)
+        wheel.add('c', .0021)
+        self.assertAlmostEqual(wheel.next_expiry(), .001)
+        self.assertEqual(wheel.expire(.0009), [])
+        self.assertEqual(wheel.expire(.001), ['a'])
+        self.assertAlmostEqual(wheel.next_expiry(), .003)
+        self.assertEqual(wheel.expire(.0029), [])
+        self.assertEqual(wheel.expire(1), ['b', 'c'])
+        self.assertEqual(wheel.next_expiry(), None)
+
+
+class BindingOffersTest(unittest.TestCase):
+    """Tests for a player's index of binding offers"""
+    def setUp(self):
+        """Sets up two offers to player 2 & one to player 3"""
+        wheat, corn = config.COMMODITIES[:2]
+        self.offers = BindingOffers()
+        self.first = Message(Message.BINDING_OFFER, uid=1, target_uid=2,
+                             cards=[wheat, wheat])
+        self.second = Message(Message.BINDING_OFFER, uid=1, target_uid=2,
+                              cards=[corn, corn])
+        self.third = Message(Message.BINDING_OFFER, uid=1, target_uid=3,
+                             cards=[corn])
+        for offer in [self.first, self.second, self.third]:
+            self.offers.add(offer)
+
+    def test_locked(self):
+        """Offered cards are locked until the offer is removed"""
+        wheat, corn = config.COMMODITIES[:2]
+        self.assertEqual(sorted(self.offers.locked),
+                         sorted([wheat, wheat, corn, corn, corn]))
+        self.offers.remove(self.second)
+        self.assertEqual(sorted(self.offers.locked), sorted([wheat, wheat, corn]))
+        self.assertFalse(self.second in self.offers)
+        self.assertEqual(len(self.offers), 2)
+
+    def test_match(self):
+        """The oldest offer to a player for a count is matched"""
+        self.assertTrue(self.offers.match(2, 2) is self.first)
+        self.assertTrue(self.offers.match(3, 1) is self.third)
+        self.assertEqual(self.offers.match(3, 2), None)
+        self.offers.remove(self.first)
+        self.assertTrue(self.offers.match(2, 2) is self.second)
+
+    def test_find(self):
+        """Offers are found by their exact cards"""
+        self.assertTrue(self.offers.find(2, self.second.cards) is self.second)
+        self.assertEqual(self.offers.find(3, self.second.cards), None)
+
+
+class BindingOfferExpiryTest(unittest.TestCase):
+    """Tests for withdrawing binding offers, by ttl or by the player"""
+    def setUp(self):
+        """Sets up an engine with two players & no sending, on a virtual clock"""
+        self.wheat = config.COMMODITIES[0]
+        self.engine = GameEngine(clock=clocks.VirtualClock())
+        self.engine.send = mock.Mock()
+        self.engine.broadcast = mock.Mock()
+        self.engine.expiry_wheel = ExpiryWheel()
+        self.engine.player_data = dict((uid, {
+            'cards': util.Hand([self.wheat] * 3),
+            'binding_offers': BindingOffers(),
+        }) for uid in [1, 2])
+
+    def make_offer(self, ttl=None):
+        """Sends a binding offer of two cards from player 1 to player 2"""
+        self.engine.process_binding_offer(Message(
+            Message.BINDING_OFFER, uid=1, target_uid=2,
+            cards=[self.wheat] * 2, ttl=ttl))
+
+    def withdrawals(self):
+        """Returns (uid, cards) for each WITHDRAW sent"""
+        return [(args[0], args[1].cards)
+                for args, _ in self.engine.send.call_args_list
+                if args[1].text == Message.WITHDRAW]
+
+    def test_ttl_expired(self):
+        """The engine withdraws an offer whose ttl is up, releasing its cards"""
+        self.make_offer(ttl=.5)
+        self.assertEqual(self.engine.expire_offers(), .5)
+        self.engine.clock.advance(.4999)
+        self.engine.expire_offers()
+        self.assertEqual(self.withdrawals(), [])
+        self.engine.clock.advance(.0001)
+        self.assertEqual(self.engine.expire_offers(), None)
+        self.assertEqual(self.withdrawals(),
+                         [(2, []), (1, [self.wheat] * 2)])
+        self.assertEqual(len(self.engine.player_data[1]['binding_offers']), 0)
+        self.assertEqual(list(self.engine.player_data[1]['binding_offers'].locked), [])
+
+    def test_withdrawn(self):
+        """A withdrawn offer releases its cards & isn't withdrawn again"""
+        self.make_offer(ttl=.5)
+        offers = self.engine.player_data[1]['binding_offers']
+        self.assertFalse(self.engine.player_data[1]['cards'].has_free(
+            [self.wheat] * 2, offers.locked))
+        self.engine.process_withdraw(Message(
+            Message.WITHDRAW, uid=1, target_uid=2, cards=[self.wheat] * 2))
+        self.assertEqual(len(offers), 0)
+        self.assertTrue(self.engine.player_data[1]['cards'].has_free(
+            [self.wheat] * 2, offers.locked))
+        self.assertEqual(len(self.withdrawals()), 2)
+        self.engine.clock.advance(1)
+        self.engine.expire_offers()
+        self.assertEqual(len(self.withdrawals()), 2)
+
+    def test_withdraw_unknown(self):
+        """Withdrawing an offer that isn't there does nothing"""
+        self.make_offer()
+        self.engine.process_withdraw(Message(
+            Message.WITHDRAW, uid=1, target_uid=2, cards=[self.wheat]))
+        self.assertEqual(self.withdrawals(), [])
+        self.assertEqual(len(self.engine.player_data[1]['binding_offers']), 1)
+
+    def test_no_ttl(self):
+        """Offers without a ttl never expire"""
+        self.make_offer()
+        self.engine.clock.advance(1000)
+        self.assertEqual(self.engine.expire_offers(), None)
+        self.assertEqual(self.withdrawals(), [])
+
+    def test_negative_offer_ttl(self):
+        """The engine won't take a negative offer_ttl"""
+        self.assertRaises(ValueError, GameEngine, offer_ttl=-1)
+
+
+class EpochTest(unittest.TestCase):
+    """Tests for skipping messages from earlier games & rounds"""
+    def test_barrier(self):
+        """A barrier only counts its own verb, from the current epoch"""
+        barrier = Barrier([1, 2], Message.ROUND_READY, 3)
+        def arrive(verb, uid, epoch):
+            return barrier.arrive(Message(verb, uid=uid, epoch=epoch).encode())
+        self.assertFalse(arrive(Message.ROUND_READY, 1, 2))
+        self.assertFalse(arrive(Message.GAME_READY, 1, 3))
+        self.assertFalse(arrive(Message.ROUND_READY, 1, 3))
+        self.assertFalse(arrive(Message.ROUND_READY, 1, 3))
+        self.assertTrue(arrive(Message.ROUND_READY, 2, 3))
+
+    def test_player_skips_stale(self):
+        """Players drop messages from earlier epochs without decoding them"""
+        player = NullPlayer('sue')
+        player.attach(transport.Channel(), transport.Channel(), 1,
+                      clocks.VirtualClock())
+        handle_offer = player.actions[Message.OFFER] = mock.Mock()
+        player.receive(Message(Message.OFFER, uid=2, count=1, epoch=2).encode())
+        self.assertEqual(player.epoch, 2)
+        batch = Message.encode_batch([
+            Message(Message.OFFER, uid=2, count=2, epoch=1).encode(),
+            Message(Message.OFFER, uid=2, count=3, epoch=3).encode(),
+            Message(Message.OFFER, uid=2, count=4, epoch=2).encode(),
+        ])
+        with mock.patch.object(Message, 'decode', side_effect=Message.decode) as decode:
+            player.receive(batch)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(player.epoch, 3)
+        self.assertEqual([args[0].count for args, _ in handle_offer.call_args_list],
+                         [1, 3])
+
+
+class RoundLoopTest(unittest.TestCase):
+    """Tests for only making plays when there's news or a timer is due"""
+    def setUp(self):
+        """Sets up a player in a round, counting its calls to make_plays"""
+        self.conn = transport.Channel()
+        self.clock = clocks.VirtualClock()
+        self.player = NullPlayer('sue')
+        self.player.make_plays = mock.Mock()
+        self.player.attach(self.conn, transport.Channel(), 1, self.clock)
+        self.player.receive(Message(Message.NEW_ROUND, epoch=1).encode())
+
+    def offer(self):
+        """Returns an encoded open offer from another player"""
+        return Message(Message.OFFER, uid=2, count=1, epoch=1).encode()
+
+    def test_wakes_on_message(self):
+        """A message gets plays made without waiting for IDLE_WAIT"""
+        self.assertTrue(self.player.step())
+        self.assertFalse(self.player.step())
+        self.conn.put(self.offer())
+        self.assertTrue(self.player.step())
+        self.assertEqual(self.player.make_plays.call_count, 2)
+        self.assertEqual(self.clock.time(), 0)
+
+    def test_wait_wakes_on_message(self):
+        """The round loop's wait ends as soon as a message arrives"""
+        self.player.clock = clocks.RealClock()
+        self.player.take_turn()
+        threading.Timer(.01, self.player.receive, [self.offer()]).start()
+        start = time.time()
+        self.player.wait_for_news()
+        self.assertTrue(time.time() - start < base.IDLE_WAIT / 2)
+        self.assertTrue(self.player.wake_event.is_set())
+
+    def test_timer(self):
+        """Plays are made when a scheduled timer is due, and not before"""
+        self.player.step()
+        self.player.schedule(.01)
+        self.assertEqual(self.player.next_wake(), .01)
+        self.clock.advance(.005)
+        self.assertFalse(self.player.step())
+        self.clock.advance_to(.01)
+        self.assertTrue(self.player.step())
+        self.assertEqual(self.player.make_plays.call_count, 2)
+        self.assertEqual(self.player.next_wake(), .01 + base.IDLE_WAIT)
+
+    def test_idle_wait(self):
+        """With no news or timers, plays are made every IDLE_WAIT"""
+        self.player.step()
+        self.clock.advance(base.IDLE_WAIT / 2)
+        self.assertFalse(self.player.step())
+        self.clock.advance_to(base.IDLE_WAIT)
+        self.assertTrue(self.player.step())
+
+    def test_binding_offer_timer(self):
+        """SimplePlayers look again when their binding offers lapse"""
+        player = basic.SimplePlayer('tim')
+        player.attach(transport.Channel(), transport.Channel(), 3, self.clock)
+        cards = [config.COMMODITIES[0]] * 2
+        player.receive(Message(Message.NEW_ROUND, cards=cards, epoch=1).encode())
+        player.attempt_response(Message(Message.OFFER, uid=2, count=2))
+        self.assertEqual(player.timers, [basic.BINDING_OFFER_LIFETIME])
+
+
+class SteppedTest(unittest.TestCase):
+    """Tests for running players on the engine's thread & a virtual clock"""
+    def play(self, seed):
+        """Plays a seeded game, returns the virtual time taken & final hands"""
+        engine = GameEngine()
+        players = [basic.SimplePlayer(name) for name in ['bob', 'joe', 'sue', 'tim']]
+        with mock.patch('sys.stdout'):
+            engine.play(players, backend=GameEngine.STEPPED, seed=seed)
+        return engine.clock.time(), sorted(
+            (data['name'], data['score'], sorted(data['cards']), data['dropped'])
+            for data in engine.player_data.values())
+
+    def test_deterministic(self):
+        """The same seed plays out the same game, to the virtual second"""
+        self.assertEqual(self.play(1), self.play(1))
+        self.assertNotEqual(self.play(1), self.play(2))
+
+
+class ThreadsTest(unittest.TestCase):
+    """Tests for running players as threads in the engine's process"""
+    def play(self, **kwargs):
+        """Plays a seeded game of SimplePlayers, returns the engine"""
+        engine = GameEngine()
+        players = [basic.SimplePlayer(name) for name in ['bob', 'joe', 'sue', 'tim']]
+        with mock.patch('sys.stdout'):
+            engine.play(players, backend=GameEngine.THREADS, seed=1, **kwargs)
+        return engine
+
+    def assertFinished(self, engine):
+        """Asserts the game was won, no cards went missing & the threads ended"""
+        data = engine.player_data.values()
+        self.assertTrue(max(player['score'] for player in data) >= config.WINNING_SCORE)
+        self.assertEqual(sum(len(player['cards']) for player in data),
+                         4 * config.COMMODITIES_PER_HAND + 2)
+        for player in data:
+            self.assertFalse(player['proc'].is_alive())
+
+    def test_game(self):
+        """A seeded game played out on threads finishes"""
+        self.assertFinished(self.play())
+
+    def test_batching(self):
+        """A seeded game played out on threads finishes, with batching"""
+        self.assertFinished(self.play(batching=True))
@@ -0,0 +1,88 @@
+"""Unit tests for the batched (NumPy) sync game engine"""
+import random
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from pit import config, util
+
+if np is not None:
+    from pit.sync import batched
+    from pit.sync.player import batched as batched_player
+
+
+@unittest.skipIf(np is None, 'needs numpy')
+class HandsTest(unittest.TestCase):
+    """Tests that hands are dealt & scored the same as pit.util"""
+    def setUp(self):
+        """Builds dealt hands plus some (nearly) winning ones"""
+        random.seed(0)
+        commodity = config.COMMODITIES[2]
+        per_hand = config.COMMODITIES_PER_HAND
+        self.hands = [
+            [commodity] * per_hand,
+            [commodity] * per_hand + [config.BULL],
+            [commodity] * per_hand + [config.BEAR],
+            [commodity] * (per_hand - 1) + [config.BULL],
+            [commodity] * (per_hand - 1) + [config.BULL, config.BEAR],
+            [commodity] * (per_hand - 2) + [config.BULL, config.COMMODITIES[0]],
+        ]
+        for players in range(3, len(config.COMMODITIES) + 1):
+            for dealer in range(players):
+                self.hands.extend(util.deal_cards(players, dealer))
+        self.counts = np.array([util.Hand(cards).counts for cards in self.hands])
+
+    def test_is_winning(self):
+        """is_winning matches util.is_winning_hand & Hand.is_winning"""
+        expected = [util.is_winning_hand(cards) for cards in self.hands]
+        self.assertEqual(batched.is_winning(self.counts).tolist(), expected)
+        expected = [util.Hand(cards).is_winning() for cards in self.hands]
+        self.assertEqual(batched.is_winning(self.counts).tolist(), expected)
+
+    def test_score(self):
+        """score matches util.score_hand & Hand.score"""
+        expected = [util.score_hand(cards) for cards in self.hands]
+        self.assertEqual(batched.score(self.counts).tolist(), expected)
+        expected = [util.Hand(cards).score() for cards in self.hands]
+        self.assertEqual(batched.score(self.counts).tolist(), expected)
+
+    def test_deal_cards(self):
+        """Each table is dealt like util.deal_cards"""
+        players, tables = 5, 50
+        engine = batched.BatchedGameEngine(tables=tables, seed=1)
+        engine.players = [None] * players
+        engine.hands = np.zeros((tables, players, batched.NUM_CARDS), dtype=int)
+        engine.dealer = np.arange(tables) % players
+        engine.deal_cards(np.arange(tables))
+        for table in range(tables):
+            dealt = util.deal_cards(players, engine.dealer[table])
+            hands = engine.hands[table]
+            self.assertEqual(hands.sum(axis=1).tolist(),
+                             [len(cards) for cards in dealt])
+            deck = util.Hand(card for cards in dealt for card in cards)
+            self.assertEqual(hands.sum(axis=0).tolist(), deck.counts)
+
+
+@unittest.skipIf(np is None, 'needs numpy')
+class PlayTest(unittest.TestCase):
+    """Tests for playing games on many tables"""
+    def play(self, seed, **kwargs):
+        """Plays seeded games with batched BasicPlayers, returns engine & wins"""
+        engine = batched.BatchedGameEngine(tables=10, seed=seed, **kwargs)
+        players = [batched_player.BatchedBasicPlayer(name)
+                   for name in ['bob', 'joe', 'sue', 'tim']]
+        wins = engine.play(players, games=10)
+        return engine, [wins[player] for player in players]
+
+    def test_all_games_finish(self):
+        """Every game gets a winner, with stuck rounds ended"""
+        engine, wins = self.play(2, max_round_cycles=300)
+        self.assertEqual(sum(wins), 10)
+        self.assertTrue(engine.total_stalled_rounds > 0)
+
+    def test_seeded(self):
+        """The same seed plays out the same"""
+        self.assertEqual(self.play(3)[1], self.play(3)[1])
@@ -0,0 +1,343 @@
+"""Unit tests for the sync game engine"""
+import itertools
+import mock
+import random
+import unittest
+
+from pit.sync import gameengine
+from pit.sync.player import base, basic
+
+
+def play(seed, **options):
+    """Plays seeded games of BasicPlayers, returns wins & scores by name"""
+    engine = gameengine.GameEngine(
+        max_round_cycles=gameengine.MAX_ROUND_CYCLES, **options)
+    players = [basic.BasicPlayer(name) for name in ['bob', 'joe', 'sue', 'tim']]
+    wins = engine.play(players, games=3, seed=seed)
+    # in concurrent mode player_info is keyed by the proxies
+    scores = dict((player.name, info['score'])
+                  for player, info in engine.player_info.items())
+    return dict((player.name, (wins[player], scores[player.name]))
+                for player in players)
+
+
+class ScriptedTrader(base.Player):
+    """Offers or answers the latest offer with a single card in given cycles
+
+    Accepts every response, and logs its turns, trades & expired offers to
+    compare rounds by.
+    """
+    def __init__(self, name, script):
+        self.name = name
+        self.script = script
+        self.log = []
+
+    def new_round(self, hand, card_counts):
+        self.hand = hand
+        self.offers = []
+
+    def get_action(self, cycle):
+        self.log.append(('turn', cycle))
+        action = self.script.get(cycle)
+        if action == 'offer':
+            return gameengine.Offer(self, 1)
+        if action == 'respond':
+            return gameengine.Response(self.offers[-1], self, self.hand[:1])
+
+    def offer_made(self, offer):
+        self.offers.append(offer)
+
+    def response_rejected(self, response):
+        self.log.append(('rejected', response.id))
+
+    def offer_expired(self, offer):
+        self.log.append(('expired', offer.id))
+
+    def response_made(self, response):
+        return self.hand[:1]
+
+    def trade_confirmation(self, response, hand=None):
+        if hand is not None:
+            self.hand = hand
+            self.log.append(('trade', response.id))
+
+
+class LateTrader(ScriptedTrader):
+    """Answers the first offer it saw, even once that round is over"""
+    def new_round(self, hand, card_counts):
+        offers = getattr(self, 'offers', [])
+        super(LateTrader, self).new_round(hand, card_counts)
+        self.offers = offers
+
+    def get_action(self, cycle):
+        if self.script.get(cycle) == 'respond':
+            self.log.append(('turn', cycle))
+            return gameengine.Response(self.offers[0], self, self.hand[:1])
+        return super(LateTrader, self).get_action(cycle)
+
+
+def play_round(max_round_cycles, **options):
+    """Plays a seeded round of ScriptedTraders, returns what happened & cycles
+
+    Each trade leaves both players busy for a few cycles, and the offer bob
+    makes first expires while they are.
+    """
+    random.seed(0)
+    engine = gameengine.GameEngine(max_round_cycles=max_round_cycles, **options)
+    engine.players = [
+        ScriptedTrader('bob', {0: 'offer', 1: 'offer', 7: 'offer'}),
+        ScriptedTrader('joe', {2: 'respond', 8: 'respond'}),
+    ]
+    engine.player_info = dict(
+        (player, {'score': 0}) for player in engine.players)
+    engine.dealer = 0
+    engine.winner = None
+    engine.action_ids = itertools.count()
+    with mock.patch.object(engine, 'one_cycle', wraps=engine.one_cycle) as one_cycle:
+        engine.one_round()
+    hands = [sorted(engine.player_info[player]['cards']) for player in engine.players]
+    return (engine.cycle, engine.stalled_rounds, hands,
+            [player.log for player in engine.players]), one_cycle.call_count
+
+
+class StalledRoundTest(unittest.TestCase):
+    """Tests for ending rounds after max_round_cycles"""
+    def setUp(self):
+        """Sets up an engine for a round of players who always pass"""
+        self.engine = gameengine.GameEngine(max_round_cycles=20)
+        self.engine.players = [base.Player() for _ in range(3)]
+        self.engine.player_info = dict(
+            (player, {'score': 0}) for player in self.engine.players)
+        self.engine.dealer = 0
+        self.engine.winner = None
+        self.engine.action_ids = itertools.count()
+
+    def test_round_ends(self):
+        """A round nobody can win ends after max_round_cycles"""
+        self.engine.one_round()
+        self.assertEqual(self.engine.cycle, 20)
+        self.assertEqual(self.engine.stalled_rounds, 1)
+        self.assertEqual(self.engine.winner, None)
+
+    def test_fast_forward(self):
+        """Skipping idle cycles doesn't go past the limit"""
+        for max_round_cycles in range(1, 12):
+            expected, _ = play_round(max_round_cycles)
+            result, _ = play_round(max_round_cycles, fast_forward=True)
+            self.assertEqual(result, expected)
+            self.assertEqual(result[:2], (max_round_cycles, 1))
+
+    def test_stale_response(self):
+        """A response to an offer from a round that's over is rejected"""
+        bob = ScriptedTrader('bob', {0: 'offer'})
+        joe = LateTrader('joe', {})
+        self.engine.max_round_cycles = 3
+        self.engine.players = [bob, joe]
+        self.engine.player_info = dict((player, {'score': 0}) for player in [bob, joe])
+        self.engine.one_round()
+        stale = joe.offers[0]
+        # bob makes the same offer in the same cycle, joe answers the old one
+        joe.script = {1: 'respond'}
+        self.engine.one_round()
+        self.assertEqual(len(joe.offers), 2)
+        self.assertNotEqual(joe.offers[1], stale)
+        rejected = [entry for entry in joe.log if entry[0] == 'rejected']
+        trades = [entry for log in [bob.log, joe.log] for entry in log
+                  if entry[0] == 'trade']
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(trades, [])
+
+
+class ActionTest(unittest.TestCase):
+    """Tests for action identity & stamping"""
+    def setUp(self):
+        """Sets up an unstamped offer"""
+        self.player = base.Player()
+        self.offer = gameengine.Offer(self.player, 2)
+
+    def test_unstamped_identity(self):
+        """Unstamped actions are only equal to themselves"""
+        other = gameengine.Offer(self.player, 2)
+        self.assertEqual(self.offer, self.offer)
+        self.assertNotEqual(self.offer, other)
+        self.assertEqual(len(set([self.offer, other])), 2)
+
+    def test_stamped_by_id(self):
+        """Stamped actions are equal & hash alike iff they have the same id"""
+        first = self.offer.stamped(7, 1)
+        same = gameengine.Offer(self.player, 3).stamped(7, 2)
+        other = gameengine.Offer(self.player, 2).stamped(8, 1)
+        self.assertTrue(first is self.offer)
+        self.assertEqual(first, same)
+        self.assertEqual(hash(first), hash(same))
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(set([first, same, other])), 2)
+        self.assertNotEqual(first, 7)
+
+    def test_stable_hash(self):
+        """An action put in a set before it's stamped is found there after"""
+        offers = set([self.offer])
+        self.offer.stamped(7, 1)
+        self.assertTrue(self.offer in offers)
+        self.assertTrue(self.offer.copy() in offers)
+
+    def test_other_player(self):
+        """Actions with the same id from different players aren't equal"""
+        other = base.Player()
+        other.name = self.player.name + ' 2'
+        self.assertNotEqual(self.offer.stamped(7, 1),
+                            gameengine.Offer(other, 2).stamped(7, 1))
+
+    def test_restamp_copies(self):
+        """Stamping an already stamped action returns a stamped copy"""
+        first = self.offer.stamped(1, 1)
+        second = first.stamped(2, 3)
+        self.assertFalse(second is first)
+        self.assertEqual((first.id, first.cycle), (1, 1))
+        self.assertEqual((second.id, second.cycle), (2, 3))
+        self.assertEqual((second.player, second.quantity), (self.player, 2))
+        self.assertNotEqual(first, second)
+
+    def test_immutable(self):
+        """Fields can't be set once an action is made"""
+        self.assertRaises(AttributeError, setattr, self.offer, 'quantity', 3)
+
+
+class InterestedPlayer(base.Player):
+    """Wants offers for the quantities it's told to"""
+    def __init__(self, name, quantities=None):
+        self.name = name
+        self.quantities = quantities
+
+    def interests(self):
+        return self.quantities
+
+
+class InterestsTest(unittest.TestCase):
+    """Tests for routing offers by the quantities players want"""
+    def setUp(self):
+        """Sets up an engine with three players at the start of a round"""
+        self.engine = gameengine.GameEngine()
+        self.players = [InterestedPlayer('bob', [1, 2]),
+                        InterestedPlayer('joe'),
+                        InterestedPlayer('sue', [2, 3])]
+        self.engine.players = self.players
+        self.engine.interests = {}
+        self.engine.subscribers = {}
+        self.engine.seats = dict((player, seat)
+                                 for seat, player in enumerate(self.players))
+        self.engine.events = dict((player, []) for player in self.players)
+        for player in self.players:
+            self.engine.update_interests(player)
+
+    def update(self, player, quantities):
+        """Changes the quantities a player wants"""
+        player.quantities = quantities
+        self.engine.update_interests(player)
+
+    def test_subscribers(self):
+        """Players are subscribed to the quantities they want, in seat order"""
+        bob, joe, sue = self.players
+        self.assertEqual(self.engine.subscribers_for(1), [bob, joe])
+        self.assertEqual(self.engine.subscribers_for(2), [bob, joe, sue])
+        self.assertEqual(self.engine.subscribers_for(4), [joe])
+
+    def test_update_in_place(self):
+        """Changing interests updates the lists, keeping seat order"""
+        bob, joe, sue = self.players
+        subscribers = [self.engine.subscribers_for(quantity)
+                       for quantity in range(1, 5)]
+        self.update(bob, [3, 4])
+        self.update(sue, [1, 2])
+        self.update(joe, [4])
+        self.assertEqual(subscribers, [[sue], [sue], [bob], [bob, joe]])
+        self.update(joe, None)
+        self.update(bob, None)
+        self.assertEqual(subscribers, [[bob, joe, sue], [bob, joe, sue],
+                                       [bob, joe], [bob, joe]])
+        for quantity, expected in zip(range(1, 5), subscribers):
+            self.assertTrue(self.engine.subscribers_for(quantity) is expected)
+
+
+class OfferBookTest(unittest.TestCase):
+    """Tests for the open offers index & expiry wheel"""
+    def setUp(self):
+        """Sets up a book with offers for 2, 2 & 3 cards"""
+        self.player = base.Player()
+        self.book = gameengine.OfferBook()
+        self.offers = [
+            gameengine.Offer(self.player, 2).stamped(0, 0),
+            gameengine.Offer(self.player, 2).stamped(1, 1),
+            gameengine.Offer(self.player, 3).stamped(2, 1),
+        ]
+        for offer in self.offers:
+            self.book.add(offer)
+
+    def test_get(self):
+        """Offers are found by id while they are open"""
+        self.assertTrue(self.book.get(1) is self.offers[1])
+        self.assertTrue(self.offers[1] in self.book)
+        self.book.remove(self.offers[1])
+        self.assertEqual(self.book.get(1), None)
+        self.assertFalse(self.offers[1] in self.book)
+        self.assertEqual(len(self.book), 2)
+
+    def test_iter(self):
+        """Open offers are listed in the order they were made"""
+        self.assertEqual(list(self.book), self.offers)
+        self.book.remove(self.offers[1])
+        self.assertEqual(list(self.book), [self.offers[0], self.offers[2]])
+
+    def test_expiry_boundary(self):
+        """Offers live through cycle + OFFER_CYCLES, expire the cycle after"""
+        last_cycle = gameengine.OFFER_CYCLES
+        self.assertEqual(self.book.next_expiry(), last_cycle + 1)
+        self.assertEqual(self.book.expire(last_cycle), [])
+        self.assertEqual(self.book.expire(last_cycle + 1), [self.offers[0]])
+        self.assertEqual(list(self.book), self.offers[1:])
+        self.assertEqual(sorted(self.book.expire(last_cycle + 2),
+                                key=lambda offer: offer.id), self.offers[1:])
+        self.assertEqual(len(self.book), 0)
+        self.assertEqual(self.book.next_expiry(), None)
+
+    def test_removed_not_expired(self):
+        """Offers removed before they expire aren't returned by expire"""
+        self.book.remove(self.offers[0])
+        self.assertEqual(self.book.expire(gameengine.OFFER_CYCLES + 1), [])
+
+
+class FastForwardTest(unittest.TestCase):
+    """Tests for skipping idle cycles"""
+    def test_same_games(self):
+        """Seeded games play out the same with & without fast forward"""
+        for seed in range(3):
+            self.assertEqual(play(seed, fast_forward=True), play(seed))
+
+    def test_same_round(self):
+        """A round with idle cycles skipped plays out the same"""
+        expected, stepped_cycles = play_round(40)
+        result, cycles = play_round(40, fast_forward=True)
+        self.assertEqual(result, expected)
+        self.assertTrue(cycles < stepped_cycles, (cycles, stepped_cycles))
+        trades = [entry for log in result[3] for entry in log
+                  if entry[0] == 'trade']
+        expired = [entry for log in result[3] for entry in log
+                   if entry[0] == 'expired']
+        self.assertTrue(trades and expired, result[3])
+
+
+class BatchEventsTest(unittest.TestCase):
+    """Tests for delivering notifications in batches"""
+    def test_same_games(self):
+        """Seeded games play out the same with & without batched events"""
+        for seed in range(3):
+            self.assertEqual(play(seed, batch_events=True), play(seed))
+
+
+class ConcurrentTest(unittest.TestCase):
+    """Tests for hosting players in their own processes"""
+    def test_seeded(self):
+        """Seeded games finish, and play out the same every time"""
+        results = play(1, concurrent=True)
+        self.assertEqual(sum(wins for wins, _ in results.values()), 3)
+        self.assertEqual(play(1, concurrent=True), results)
@@ -0,0 +1,69 @@
+"""Unit tests for the async engine's player pool"""
+import mock
+import multiprocessing
+import os
+import unittest
+
+from pit.async import pool
+from pit.async.gameengine import GameEngine
+from pit.async.player import basic
+
+
+class ReportingPlayer(basic.SimplePlayer):
+    """Reports its process & how many games it has seen at each new game
+
+    reports must be set before the pool is made, so the workers inherit it.
+    """
+    reports = None
+
+    def new_game(self, message):
+        self.games = getattr(self, 'games', 0) + 1
+        self.reports.put((self.name, os.getpid(), self.games))
+        super(ReportingPlayer, self).new_game(message)
+
+
+class PlayerPoolTest(unittest.TestCase):
+    """Tests for leasing & reusing player workers"""
+    def setUp(self):
+        """Sets up a pool of four workers"""
+        ReportingPlayer.reports = multiprocessing.Queue()
+        self.pool = pool.PlayerPool(4)
+
+    def tearDown(self):
+        """Stops the workers"""
+        self.pool.close()
+
+    def play(self, players):
+        """Plays a game with the pool, returns the players' reports by name"""
+        with mock.patch('sys.stdout'):
+            GameEngine().play(players, pool=self.pool, seed=1)
+        reports = [ReportingPlayer.reports.get(timeout=5) for _ in players]
+        return dict((name, (pid, games)) for name, pid, games in reports)
+
+    def test_lease(self):
+        """Workers are leased until none are idle, and released for reuse"""
+        leased = self.pool.lease(3)
+        self.assertRaises(ValueError, self.pool.lease, 2)
+        self.pool.release(leased[:2])
+        self.assertEqual(set(self.pool.lease(3)),
+                         set(self.pool.workers) - set(leased[2:]))
+
+    def test_reuse(self):
+        """Released workers play the next match, with new players"""
+        pids = set(worker.proc.pid for worker in self.pool.workers)
+        first = self.play([ReportingPlayer(name) for name in ['bob', 'joe', 'sue', 'tim']])
+        self.assertEqual(len(self.pool.idle), 4)
+        second = self.play([ReportingPlayer(name) for name in ['ann', 'max', 'sam', 'zoe']])
+        self.assertEqual(len(self.pool.idle), 4)
+        self.assertEqual(set(pid for pid, _ in first.values()), pids)
+        self.assertEqual(set(pid for pid, _ in second.values()), pids)
+        self.assertTrue(all(worker.proc.is_alive() for worker in self.pool.workers))
+
+    def test_reset(self):
+        """Players start each match afresh, whichever worker they get"""
+        names = ['bob', 'joe', 'sue']
+        players = [ReportingPlayer(name) for name in names]
+        for _ in range(2):
+            reports = self.play(players)
+            self.assertEqual(sorted(reports), names)
+            self.assertEqual([games for _, games in reports.values()], [1] * 3)
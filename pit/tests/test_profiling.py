@@ -0,0 +1,61 @@
+"""Unit tests for the sync engine profiler"""
+import mock
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+import pit
+from pit.sync import profiling
+
+
+class TimingsTest(unittest.TestCase):
+    """Tests for the duration histogram"""
+    def test_percentiles_within_bucket_base(self):
+        """Percentiles are at least the true value & within BUCKET_BASE of it"""
+        timings = profiling.Timings()
+        durations = [n * 1e-6 for n in range(1, 1001)]
+        for duration in durations:
+            timings.add(duration)
+        for percent in [1, 10, 50, 90, 99]:
+            actual = durations[len(durations) * percent // 100 - 1]
+            reported = timings.percentile(percent)
+            self.assertTrue(actual <= reported <= actual * profiling.BUCKET_BASE,
+                            (percent, actual, reported))
+
+    def test_zero_durations(self):
+        """Durations too short to measure are reported as zero"""
+        timings = profiling.Timings()
+        timings.add(0.0)
+        timings.add(0.0)
+        timings.add(1e-3)
+        self.assertEqual(timings.percentile(50), 0.0)
+        self.assertEqual(timings.percentile(100), 1e-3)
+
+
+class TimerTest(unittest.TestCase):
+    """Tests for the clock durations are read from"""
+    def test_resolution(self):
+        """The timer can tell apart times well under a microsecond apart"""
+        self.assertTrue(profiling.timer_overhead() < 1e-6)
+
+    def test_not_picked_on_import(self):
+        """Importing the engine doesn't go looking for a clock"""
+        code = ('from pit.sync import gameengine, profiling; '
+                'print profiling._timer is None')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(pit.__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(output.strip(), 'True')
+
+    def test_other_platforms(self):
+        """The Linux clock id isn't used elsewhere"""
+        with mock.patch('sys.platform', 'darwin'):
+            self.assertEqual(profiling._monotonic_timer(), None)
+
+    def test_fallback(self):
+        """Any error reading the monotonic clock falls back to time.time"""
+        with mock.patch('ctypes.CDLL', side_effect=ValueError), \
+                mock.patch.object(profiling, '_timer', None):
+            self.assertEqual(profiling._monotonic_timer(), None)
+            self.assertTrue(profiling.get_timer() is time.time)
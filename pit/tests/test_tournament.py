@@ -0,0 +1,28 @@
+"""Unit tests for playing sync games across processes"""
+import unittest
+
+from pit.sync import gameengine, tournament
+from pit.sync.player import basic
+
+
+class TournamentTest(unittest.TestCase):
+    """Tests that results don't depend on how games are spread out"""
+    def setUp(self):
+        """Sets up four BasicPlayers"""
+        self.players = [basic.BasicPlayer(name)
+                        for name in ['bob', 'joe', 'sue', 'tim']]
+
+    def wins(self, results):
+        """Returns the wins by player name"""
+        return dict((player.name, count) for player, count in results.items())
+
+    def test_any_number_of_workers(self):
+        """Seeded games have the same winners whatever the number of workers"""
+        expected = self.wins(gameengine.GameEngine(
+            max_round_cycles=gameengine.MAX_ROUND_CYCLES).play(
+                self.players, games=12, seed=3))
+        self.assertEqual(sum(expected.values()), 12)
+        for processes in [1, 3]:
+            results = tournament.play(self.players, games=12, seed=3,
+                                      processes=processes, chunk_size=5)
+            self.assertEqual(self.wins(results), expected)
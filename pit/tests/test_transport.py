@@ -0,0 +1,147 @@
+"""Unit tests for the async engine's transports"""
+import multiprocessing
+import Queue
+import threading
+import unittest
+
+from pit.async import transport
+
+
+class RingTest(unittest.TestCase):
+    """Tests for the shared memory ring buffer"""
+    def setUp(self):
+        """Sets up a small ring"""
+        self.ring = transport.Ring(slots=4, slot_size=16)
+
+    def test_framing(self):
+        """Messages of any length that fits come back as they were sent"""
+        messages = ['', 'a', '\x00\xff' * 3, 'x' * self.ring.max_size]
+        for data in messages:
+            self.ring.put(data)
+        self.assertEqual([self.ring.get() for _ in messages], messages)
+        self.assertRaises(ValueError, self.ring.put, 'x' * (self.ring.max_size + 1))
+
+    def test_wraparound(self):
+        """Slots are reused in order once the counters pass the ring's size"""
+        received = []
+        total = 4 * self.ring.slots + 1
+        for count in range(total):
+            self.ring.put(str(count))
+            if count % 3 == 2:
+                received.extend(self.ring.get_all())
+        received.extend(self.ring.get_all())
+        self.assertEqual(received, [str(count) for count in range(total)])
+        self.assertEqual((self.ring.head, self.ring.tail), (total, total))
+        self.assertFalse(self.ring.poll())
+
+    def test_full(self):
+        """Putting to a full ring waits until a message is taken"""
+        for count in range(self.ring.slots):
+            self.ring.put(str(count))
+        producer = threading.Thread(target=self.ring.put, args=('last',))
+        producer.daemon = True
+        producer.start()
+        producer.join(.05)
+        self.assertTrue(producer.is_alive())
+        self.assertEqual(self.ring.get(), '0')
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(self.ring.get_all(), ['1', '2', '3', 'last'])
+
+    def test_poll(self):
+        """poll tells whether get would return at once"""
+        self.assertFalse(self.ring.poll())
+        self.ring.send_bytes('a')
+        self.assertTrue(self.ring.poll())
+        self.assertEqual(self.ring.recv_bytes(), 'a')
+        self.assertFalse(self.ring.poll())
+
+
+class RingSetTest(unittest.TestCase):
+    """Tests for reading many rings like a Queue"""
+    def setUp(self):
+        """Sets up a set of three small rings"""
+        self.rings = [transport.Ring(slots=8, slot_size=16) for _ in range(3)]
+        self.ring_set = transport.RingSet(self.rings)
+
+    def test_sweep_in_turn(self):
+        """Each sweep takes everything from each ring in turn"""
+        self.rings[1].put('b1')
+        self.rings[0].put('a1')
+        self.rings[1].put('b2')
+        self.assertEqual(self.ring_set.get(), 'a1')
+        self.rings[2].put('c1')
+        self.assertEqual(self.ring_set.get(), 'b1')
+        self.assertEqual(self.ring_set.get(), 'b2')
+        self.assertEqual(self.ring_set.get(), 'c1')
+
+    def test_empty(self):
+        """Getting from empty rings raises Queue.Empty unless blocking"""
+        self.assertRaises(Queue.Empty, self.ring_set.get_nowait)
+        self.assertRaises(Queue.Empty, self.ring_set.get, True, .01)
+        self.rings[2].put('c1')
+        self.assertEqual(self.ring_set.get(timeout=.01), 'c1')
+
+
+class PipeSetTest(unittest.TestCase):
+    """Tests for reading many pipes like a Queue, taking turns"""
+    def setUp(self):
+        """Sets up a set of three one way pipes"""
+        self.senders = {}
+        receivers = {}
+        for uid in ['a', 'b', 'c']:
+            receivers[uid], self.senders[uid] = multiprocessing.Pipe(False)
+        self.pipe_set = transport.PipeSet(receivers)
+
+    def send(self, uid, count):
+        """Sends count messages from a player, named for it & numbered"""
+        for data in self.messages(uid, count):
+            self.senders[uid].send_bytes(data)
+
+    def messages(self, uid, count):
+        """Returns the messages send sends"""
+        return ['{0}{1}'.format(uid, number) for number in range(1, count + 1)]
+
+    def test_round_robin(self):
+        """A busy player's messages are handed out in turn with the others'"""
+        self.send('a', 4)
+        self.send('b', 1)
+        self.send('c', 2)
+        received = [self.pipe_set.get(timeout=1) for _ in range(7)]
+        for uid, count in [('a', 4), ('b', 1), ('c', 2)]:
+            self.assertEqual([data for data in received if data[0] == uid],
+                             self.messages(uid, count))
+        # nobody gets a second turn before everyone waiting has had one
+        self.assertEqual(sorted(data[0] for data in received[:3]), ['a', 'b', 'c'])
+        self.assertEqual(sorted(data[0] for data in received[3:5]), ['a', 'c'])
+        self.assertEqual(received[5:], ['a3', 'a4'])
+
+    def test_backlog(self):
+        """Messages read ahead wait in the backlog until they are got"""
+        self.send('a', 3)
+        self.assertEqual(self.pipe_set.get(timeout=1), 'a1')
+        self.assertEqual(self.pipe_set.backlog('a'), 2)
+        self.assertEqual(self.pipe_set.backlog('b'), 0)
+        self.send('b', 1)
+        # the backlog is drained before the pipes are read again
+        self.assertEqual([self.pipe_set.get_nowait() for _ in range(2)], ['a2', 'a3'])
+        self.assertEqual(self.pipe_set.backlog('a'), 0)
+        self.assertEqual(self.pipe_set.get(timeout=1), 'b1')
+        self.assertRaises(Queue.Empty, self.pipe_set.get_nowait)
+
+    def test_max_reads(self):
+        """A sweep reads at most MAX_READS messages from a pipe"""
+        count = transport.MAX_READS + 2
+        self.send('a', count)
+        self.pipe_set.sweep(1)
+        self.assertEqual(self.pipe_set.backlog('a'), transport.MAX_READS)
+        received = [self.pipe_set.get(timeout=1) for _ in range(count)]
+        self.assertEqual(received, self.messages('a', count))
+
+    def test_closed(self):
+        """Pipes whose player has gone away are dropped"""
+        self.senders['c'].close()
+        self.assertRaises(Queue.Empty, self.pipe_set.get, True, .01)
+        self.assertEqual(len(self.pipe_set.conns), 2)
+        self.send('a', 1)
+        self.assertEqual(self.pipe_set.get(timeout=1), 'a1')
@@ -160,6 +160,47 @@ class HandTest(unittest.TestCase):
         self.assertEqual(score, -(config.BEAR_PENALTY+config.BULL_PENALTY))
 
 
+class HandValuesTest(unittest.TestCase):
+    """Tests for the hand signature lookup table"""
+    def test_signature(self):
+        """Lists and Hands of the same cards have the same signature"""
+        commodity = config.COMMODITIES[1]
+        cards = [commodity] * (config.COMMODITIES_PER_HAND - 1) + [config.BULL]
+        signature = (commodity, config.COMMODITIES_PER_HAND - 1, True, False)
+        self.assertEqual(util.hand_signature(cards), signature)
+        self.assertEqual(util.hand_signature(util.Hand(cards)), signature)
+
+    def test_losing_signature(self):
+        """Hands that can't win all have the same signature"""
+        commodity = config.COMMODITIES[1]
+        signature = (None, 0, True, False)
+        for cards in [[commodity] * 5 + [config.COMMODITIES[4]] * 3 + [config.BULL],
+                      [commodity] * (config.COMMODITIES_PER_HAND - 2) +
+                      [config.COMMODITIES[4], config.BULL]]:
+            self.assertEqual(util.hand_signature(cards), signature)
+            self.assertEqual(util.hand_signature(util.Hand(cards)), signature)
+
+    def test_dealt_hands_in_table(self):
+        """Every dealt hand's signature is in the table"""
+        for cards in util.deal_cards(len(config.COMMODITIES), 0):
+            self.assertTrue(util.hand_signature(cards) in util.HAND_VALUES)
+
+    def test_values(self):
+        """Table values match scoring rules"""
+        commodity = config.COMMODITIES[0]
+        value = config.COMMODITY_VALUES[commodity]
+        cards = [commodity] * config.COMMODITIES_PER_HAND + [config.BULL]
+        self.assertEqual(util.hand_value(cards), (True, value * 2))
+        self.assertEqual(util.hand_value(util.Hand(cards)), (True, value * 2))
+        cards = [commodity] * (config.COMMODITIES_PER_HAND - 1) + [config.BEAR]
+        self.assertEqual(util.hand_value(cards), (False, -config.BEAR_PENALTY))
+
+    def test_unknown_cards(self):
+        """Hands of made up cards still win, but are worth nothing"""
+        cards = ['a'] * config.COMMODITIES_PER_HAND
+        self.assertEqual(util.hand_value(cards), (True, 0))
+
+
 class AvailableCardGroupsTest(unittest.TestCase):
     """Tests for available_card_groups"""
     def setUp(self):
@@ -274,3 +315,92 @@ class DealTest(unittest.TestCase):
                    [config.BULL, config.BEAR]
         self.assertEqual(sorted(cards), sorted(expected))
 
+
+class CountHandTest(unittest.TestCase):
+    """Tests for the count-based Hand type"""
+    def setUp(self):
+        """Creates a hand with a few commodities plus the bull"""
+        self.wheat, self.corn = config.COMMODITIES[0], config.COMMODITIES[3]
+        self.cards = [self.wheat] * 3 + [self.corn] * 2 + [config.BULL]
+        self.hand = util.Hand(self.cards)
+
+    def test_counts(self):
+        """Hand counts, length and membership match the card list"""
+        self.assertEqual(len(self.hand), len(self.cards))
+        self.assertEqual(self.hand.count(self.wheat), 3)
+        self.assertTrue(config.BULL in self.hand)
+        self.assertFalse(config.BEAR in self.hand)
+        self.assertFalse('a' in self.hand)
+
+    def test_to_list(self):
+        """Hand converts back to the same list of cards"""
+        self.assertEqual(sorted(self.hand.to_list()), sorted(self.cards))
+
+    def test_has(self):
+        """has respects both hand counts and locked groups"""
+        self.assertTrue(self.hand.has([self.wheat, self.wheat]))
+        self.assertFalse(self.hand.has([self.corn] * 3))
+        locked = [mock.Mock(cards=[self.wheat, self.wheat])]
+        self.assertTrue(util.has_cards([self.wheat], self.hand, locked))
+        self.assertFalse(util.has_cards([self.wheat] * 2, self.hand, locked))
+
+    def test_has_free(self):
+        """has_free respects both hand counts and a Hand of locked cards"""
+        locked = util.Hand([self.wheat, self.wheat])
+        self.assertTrue(self.hand.has_free([self.wheat, self.corn], locked))
+        self.assertFalse(self.hand.has_free([self.wheat] * 2, locked))
+        self.assertFalse(self.hand.has_free([config.BEAR], util.Hand()))
+
+    def test_remove_missing(self):
+        """Removing missing cards raises ValueError and leaves hand intact"""
+        self.assertRaises(ValueError, self.hand.remove, [config.BEAR])
+        self.assertEqual(len(self.hand), len(self.cards))
+        self.assertRaises(ValueError, self.hand.remove,
+                          [self.wheat, self.corn, self.corn, self.corn])
+        self.assertRaises(ValueError, self.hand.remove, [self.wheat, 'a'])
+        self.assertEqual(sorted(self.hand.to_list()), sorted(self.cards))
+
+    def test_has_unknown(self):
+        """A hand doesn't have cards that aren't in the deck"""
+        self.assertFalse(self.hand.has([self.wheat, 'a']))
+        self.assertFalse(util.has_cards(['a'], self.hand, []))
+
+    def test_swap(self):
+        """swap_cards works on Hands"""
+        other = util.Hand([config.BEAR, self.corn])
+        util.swap_cards(self.hand, [self.wheat], other, [config.BEAR])
+        self.assertEqual(self.hand.count(self.wheat), 2)
+        self.assertTrue(config.BEAR in self.hand)
+        self.assertEqual(sorted(other.to_list()), sorted([self.wheat, self.corn]))
+
+    def test_trade_missing(self):
+        """A trade either hand can't make raises ValueError, changing neither"""
+        other_cards = [config.BEAR, self.corn]
+        other = util.Hand(other_cards)
+        for give, take in [([self.wheat] * 4, [self.corn]),
+                           ([self.wheat], [self.corn] * 2),
+                           ([self.wheat], ['a'])]:
+            self.assertRaises(ValueError, self.hand.trade, give, other, take)
+            self.assertEqual(sorted(self.hand.to_list()), sorted(self.cards))
+            self.assertEqual(sorted(other.to_list()), sorted(other_cards))
+
+    def test_matches_list_scoring(self):
+        """Winning hand checks and scores match the list versions"""
+        commodity = config.COMMODITIES[2]
+        hands = [
+            [commodity] * config.COMMODITIES_PER_HAND,
+            [commodity] * config.COMMODITIES_PER_HAND + [config.BULL],
+            [commodity] * (config.COMMODITIES_PER_HAND - 1) + [config.BULL],
+            [commodity] * config.COMMODITIES_PER_HAND + [config.BEAR],
+            [commodity] * 4 + [self.corn] * 3 + [config.BULL, config.BEAR],
+        ]
+        for cards in hands:
+            hand = util.Hand(cards)
+            self.assertEqual(hand.is_winning(), util.is_winning_hand(cards))
+            self.assertEqual(util.score_hand(hand), util.score_hand(cards))
+
+    def test_available_card_groups(self):
+        """available_card_groups gives the same result for Hands"""
+        locked = [self.wheat, config.BULL, config.BEAR]
+        self.assertEqual(util.available_card_groups(self.hand, locked),
+                         util.available_card_groups(self.cards, locked))
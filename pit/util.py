@@ -6,8 +6,147 @@ import random
 from pit import config
 
 
+# every type of card in the deck, in the order used to index Hand counts
+CARDS = config.COMMODITIES + [config.BULL, config.BEAR]
+CARD_INDEX = dict((card, index) for index, card in enumerate(CARDS))
+NUM_COMMODITIES = len(config.COMMODITIES)
+BULL_INDEX = CARD_INDEX[config.BULL]
+BEAR_INDEX = CARD_INDEX[config.BEAR]
+
+
+class Hand(object):
+    """A hand of cards stored as a fixed-size array of counts per card type.
+
+    The game engines keep player hands as Hands so that membership checks,
+    trades and winning hand checks don't have to copy and search lists of
+    card names. Players still send and receive plain lists, use to_list to
+    convert at that boundary.
+    """
+    __slots__ = ('counts',)
+
+    def __init__(self, cards=()):
+        self.counts = [0] * len(CARDS)
+        self.add(cards)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __iter__(self):
+        for index, count in enumerate(self.counts):
+            for _ in range(count):
+                yield CARDS[index]
+
+    def __contains__(self, card):
+        return self.count(card) > 0
+
+    def __repr__(self):
+        return 'Hand({0})'.format(self.to_list())
+
+    def copy(self):
+        """Returns a new Hand with the same cards"""
+        hand = Hand()
+        hand.counts = self.counts[:]
+        return hand
+
+    def to_list(self):
+        """Returns the cards as a list, e.g. to pass to a player"""
+        return list(self)
+
+    def count(self, card):
+        """Returns number of this card in the hand"""
+        index = CARD_INDEX.get(card)
+        return 0 if index is None else self.counts[index]
+
+    def add(self, cards):
+        """Adds a list of cards to the hand"""
+        counts = self.counts
+        for card in cards:
+            counts[CARD_INDEX[card]] += 1
+
+    def remove(self, cards):
+        """Removes a list of cards from the hand
+
+        Raises ValueError (like list.remove) if any of the cards are missing,
+        in which case the hand is left unchanged.
+        """
+        try:
+            indexes = [CARD_INDEX[card] for card in cards]
+        except KeyError:
+            raise ValueError('Hand.remove: cards not in hand')
+        counts = self.counts
+        for index in indexes:
+            counts[index] -= 1
+        if min(counts) < 0:
+            for index in indexes:
+                counts[index] += 1
+            raise ValueError('Hand.remove: cards not in hand')
+
+    def trade(self, give, other, take):
+        """Gives cards to another Hand in exchange for cards from it
+
+        Does what swap_cards does, in one pass over the cards. Raises
+        ValueError if either hand is missing cards, leaving both unchanged.
+        """
+        try:
+            gave = [CARD_INDEX[card] for card in give]
+            took = [CARD_INDEX[card] for card in take]
+        except KeyError:
+            raise ValueError('Hand.trade: cards not in hand')
+        mine, theirs = self.counts, other.counts
+        for index in gave:
+            mine[index] -= 1
+            theirs[index] += 1
+        for index in took:
+            theirs[index] -= 1
+            mine[index] += 1
+        if min(mine) < 0 or min(theirs) < 0:
+            other.trade(give, self, take)
+            raise ValueError('Hand.trade: cards not in hand')
+
+    def has(self, cards, locked_groups=()):
+        """Returns True if cards are in the hand after removing locked cards
+
+        locked_groups expected to be a list of objects with a 'cards' attribute.
+        """
+        counts = self.counts[:]
+        try:
+            for card in cards:
+                counts[CARD_INDEX[card]] -= 1
+        except KeyError:
+            return False
+        for group in locked_groups:
+            for card in group.cards:
+                # locked cards only matter if they're among those wanted
+                if card in cards:
+                    counts[CARD_INDEX[card]] -= 1
+        return min(counts) >= 0
+
+    def has_free(self, cards, locked):
+        """Returns True if cards are in the hand besides the locked ones
+
+        Like has, but with the locked cards already counted up in a Hand.
+        """
+        needed = Hand(cards).counts
+        counts, locked = self.counts, locked.counts
+        for index, count in enumerate(needed):
+            if count and counts[index] - locked[index] < count:
+                return False
+        return True
+
+    def is_winning(self):
+        """Returns True if these cards represent a winning hand"""
+        return HAND_VALUES[hand_signature(self)][0]
+
+    def score(self):
+        """Returns point value for this hand"""
+        return HAND_VALUES[hand_signature(self)][1]
+
+
 def swap_cards(cards1, trade1, cards2, trade2):
-    """Swaps the traded cards between two lists"""
+    """Swaps the traded cards between two lists (or Hands)"""
+    if isinstance(cards1, Hand):
+        cards1.trade(trade1, cards2, trade2)
+        return
     [cards1.remove(card) for card in trade1]
     cards1.extend(trade2)
     [cards2.remove(card) for card in trade2]
@@ -19,6 +158,8 @@ def has_cards(search_cards, cards, locked_groups):
 
     locked_groups expected to be a list of objects with a 'cards' attribute.
     """
+    if isinstance(cards, Hand):
+        return cards.has(search_cards, locked_groups)
     cards = copy.copy(cards)
     [[cards.remove(card) for card in group.cards] for group in locked_groups]
     try:
@@ -31,27 +172,93 @@ def has_cards(search_cards, cards, locked_groups):
 def is_winning_hand(cards):
     """Returns True if these cards represent a winning hand.
     """
-    if config.BEAR in cards:
-        return False
-    count = cards.count(max(set(cards), key=cards.count))
-    return count == config.COMMODITIES_PER_HAND or (
-           count == (config.COMMODITIES_PER_HAND - 1) and config.BULL in cards)
+    return HAND_VALUES[hand_signature(cards)][0]
 
 
 def score_hand(cards):
     """Returns point value for this hand"""
-    if is_winning_hand(cards):
-        commodity = max(set(cards), key=cards.count)
-        score = config.COMMODITY_VALUES[commodity]
-        if cards.count(commodity) == config.COMMODITIES_PER_HAND and config.BULL in cards:
+    return HAND_VALUES[hand_signature(cards)][1]
+
+
+def hand_signature(cards):
+    """Returns (commodity, count, bull, bear) for a list of cards (or Hand)
+
+    That's the commodity the hand has most of and how many, and whether it
+    has the bull and the bear: all that decides whether a hand wins and its
+    score. It's the hand's key into HAND_VALUES. Hands that can't win are
+    only worth their bull & bear penalties, so they all have commodity None
+    and count 0, which for lists can often be told without counting cards.
+
+    Only a Hand's signature is read straight off its counts, so only Hands
+    are evaluated in one step. A list that might win still has its cards
+    counted first: keep cards in a Hand where that matters, as the engines
+    do.
+    """
+    if isinstance(cards, Hand):
+        counts = cards.counts
+        bull, bear = counts[BULL_INDEX], counts[BEAR_INDEX]
+        count = max(counts[:NUM_COMMODITIES])
+        if bear or count < config.COMMODITIES_PER_HAND - 1:
+            return (None, 0, bull, bear)
+        return (CARDS[counts.index(count)], count, bull, bear)
+    kinds = set(cards)
+    bull, bear = config.BULL in kinds, config.BEAR in kinds
+    # the most there can be of any one card, with one of each other kind
+    if bear or len(cards) - len(kinds) + 1 < config.COMMODITIES_PER_HAND - 1:
+        return (None, 0, bull, bear)
+    commodity = max(kinds, key=cards.count)
+    count = cards.count(commodity)
+    if count < config.COMMODITIES_PER_HAND - 1:
+        return (None, 0, bull, bear)
+    return (commodity, count, bull, bear)
+
+
+def hand_value(cards):
+    """Returns (is_winning, score) for a list of cards (or Hand)"""
+    return HAND_VALUES[hand_signature(cards)]
+
+
+def _hand_value(commodity, count, bull, bear):
+    """Works out (is_winning, score) for a hand signature, see HAND_VALUES"""
+    winning = not bear and (count == config.COMMODITIES_PER_HAND or (
+              count == (config.COMMODITIES_PER_HAND - 1) and bull))
+    if winning:
+        score = config.COMMODITY_VALUES.get(commodity, 0)
+        if count == config.COMMODITIES_PER_HAND and bull:
             score *= 2
     else:
         score = 0
-        if config.BEAR in cards:
+        if bear:
             score -= config.BEAR_PENALTY
-        if config.BULL in cards:
+        if bull:
             score -= config.BULL_PENALTY
-    return score
+    return winning, score
+
+
+class HandValues(dict):
+    """(is_winning, score) by hand signature
+
+    Filled in with every signature a hand dealt from the configured
+    commodities can have: it holds at most one more card than
+    COMMODITIES_PER_HAND and one bull & bear. Signatures have the bull &
+    bear as counts or bools, which are the same keys. Any others (e.g. made
+    up card names, which are worth nothing) are worked out on the spot.
+    """
+    def __init__(self):
+        signatures = [(None, 0, bull, bear) for bull in (0, 1) for bear in (0, 1)]
+        signatures.extend(
+            (commodity, count, bull, 0)
+            for commodity in config.COMMODITIES
+            for count in range(config.COMMODITIES_PER_HAND - 1,
+                               config.COMMODITIES_PER_HAND + 2)
+            for bull in (0, 1))
+        super(HandValues, self).__init__(
+            (signature, _hand_value(*signature)) for signature in signatures)
+
+    def __missing__(self, signature):
+        return _hand_value(*signature)
+
+HAND_VALUES = HandValues()
 
 
 def available_card_groups(cards, locked_cards):
@@ -59,6 +266,17 @@ def available_card_groups(cards, locked_cards):
 
     This ignores errors caused if a locked card is no longer in cards.
     """
+    if isinstance(cards, Hand):
+        counts = cards.counts[:]
+        for card in locked_cards:
+            index = CARD_INDEX.get(card)
+            if index is not None:
+                counts[index] -= 1
+        card_groups = {}
+        for card, count in zip(CARDS, counts):
+            if count > 0:
+                card_groups[card] = count
+        return card_groups
     cards = copy.copy(cards)
     for card in locked_cards:
         try: